@@ -0,0 +1,655 @@
+#!/usr/bin/env python3
+"""Benchmark the Oz interpreter on generated programs."""
+import os
+import tracemalloc
+from argparse import ArgumentParser
+from tempfile import gettempdir
+from time import perf_counter
+
+from ozi import Ident, Interpreter, Literal
+from ozi_mp import ParallelInterpreter
+
+
+def _list_ast(length):
+    """Get the AST of the list [1 1 ... 1] of the given length."""
+    ast = Literal(None)
+    for _ in range(length):
+        ast = (
+            "record",
+            Literal("|"),
+            [(Literal("1"), Literal(1)), (Literal("2"), ast)],
+        )
+    return ast
+
+
+def _sum_proc():
+    """Get the AST of a recursive procedure summing up a list.
+
+    Oz equivalent:
+        proc {$ L Acc R}
+            case L of H|T then
+                local A in A = Acc + H {Sum T A R} end
+            else R = Acc end
+        end
+    """
+    return [
+        "proc",
+        [Ident("l"), Ident("acc"), Ident("r")],
+        [
+            "match",
+            Ident("l"),
+            (
+                "record",
+                Literal("|"),
+                [(Literal("1"), Ident("h")), (Literal("2"), Ident("t"))],
+            ),
+            [
+                "var",
+                Ident("a"),
+                [
+                    ["bind", Ident("a"), ["sum", Ident("acc"), Ident("h")]],
+                    [
+                        "apply",
+                        Ident("sum"),
+                        Ident("t"),
+                        Ident("a"),
+                        Ident("r"),
+                    ],
+                ],
+            ],
+            ["bind", Ident("r"), Ident("acc")],
+        ],
+    ]
+
+
+def _sum_call():
+    """Get the AST of a call summing up the list `xs` with `sum`."""
+    return [
+        "var",
+        Ident("zero"),
+        [
+            ["bind", Ident("zero"), Literal(0)],
+            [
+                "var",
+                Ident("r"),
+                [
+                    "apply",
+                    Ident("sum"),
+                    Ident("xs"),
+                    Ident("zero"),
+                    Ident("r"),
+                ],
+            ],
+        ],
+    ]
+
+
+def recursion(size):
+    """Get a program summing up a list many times with a recursive procedure.
+
+    Oz equivalent:
+        local Xs Sum in
+            Xs = [1 1 ... 1]  % of length 100
+            Sum = proc {$ L Acc R} ... end  % see `_sum_proc`
+            local R in {Sum Xs 0 R} end
+            ...
+        end
+    """
+    return [
+        "var",
+        Ident("xs"),
+        [
+            "var",
+            Ident("sum"),
+            [
+                ["bind", Ident("xs"), _list_ast(100)],
+                ["bind", Ident("sum"), _sum_proc()],
+            ]
+            + [_sum_call()] * size,
+        ],
+    ]
+
+
+def ground(size):
+    """Get a program with many equal lists, which are ground values.
+
+    Oz equivalent:
+        local Xs in
+            Xs = [1 1 ... 1]  % of length 100
+            local Y in Y = [1 1 ... 1] Xs = [1 1 ... 1] end
+            ...  % `size` times in total
+        end
+    """
+    bind = [
+        "var",
+        Ident("y"),
+        [
+            ["bind", Ident("y"), _list_ast(100)],
+            ["bind", Ident("xs"), _list_ast(100)],
+        ],
+    ]
+    return [
+        "var",
+        Ident("xs"),
+        [["bind", Ident("xs"), _list_ast(100)]] + [bind] * size,
+    ]
+
+
+def forkjoin(size):
+    """Get a program splitting the `recursion` benchmark across threads.
+
+    Oz equivalent:
+        local Xs Sum D1 ... D8 in
+            Xs = [1 1 ... 1]  % of length 100
+            Sum = proc {$ L Acc R} ... end  % see `_sum_proc`
+            thread
+                local R in {Sum Xs 0 R} end
+                ...  % `size` / 8 times in total
+                D1 = true
+            end
+            ...  % 8 threads in total
+            if D1 then skip else skip end
+            ...  % waits for all threads
+        end
+    """
+    num_threads = 8
+    done = [Ident(f"d{i}") for i in range(num_threads)]
+    forks = [
+        [
+            "thread",
+            [_sum_call()] * (size // num_threads)
+            + [["bind", var, Literal(True)]],
+        ]
+        for var in done
+    ]
+    joins = [["conditional", var, ["nop"], ["nop"]] for var in done]
+
+    ast = [
+        ["bind", Ident("xs"), _list_ast(100)],
+        ["bind", Ident("sum"), _sum_proc()],
+    ]
+    ast += forks + joins
+    for var in [Ident("xs"), Ident("sum")] + done:
+        ast = ["var", var, ast]
+    return ast
+
+
+def threads(size):
+    """Get a program with many threads suspended at once.
+
+    All the threads are spawned from the same statement in the same
+    environment, so they share their initial frame.
+
+    Oz equivalent:
+        local X in
+            thread if X then skip else skip end end
+            ...  % `size` times in total
+            X = true
+        end
+    """
+    wait = ["thread", ["conditional", Ident("x"), ["nop"], ["nop"]]]
+    return [
+        "var",
+        Ident("x"),
+        [wait] * size + [["bind", Ident("x"), Literal(True)]],
+    ]
+
+
+def ports(size):
+    """Get a program with many producers sending to one consumer over a port.
+
+    Every producer sends the items of a list, and then `done`, and the
+    consumer sums up the items until every producer is done.
+
+    Oz equivalent:
+        local S P Xs Ns Produce Consume in
+            {NewPort S P}
+            Xs = [1 1 ... 1]  % of length `size` / 8
+            Ns = [1 1 ... 1]  % of length 8
+            Produce = proc {$ L}
+                case L of H|T then {Send P item(H)} {Produce T}
+                else {Send P done} end
+            end
+            Consume = proc {$ S Left Acc R}
+                case S of H|T then
+                    case H of item(V) then
+                        local A in A = Acc + V {Consume T Left A R} end
+                    else
+                        case Left of _|L then
+                            case L of _|_ then {Consume T L Acc R}
+                            else R = Acc end
+                        else skip end
+                    end
+                else skip end
+            end
+            thread {Produce Xs} end
+            ...  % 8 threads in total
+            local R in {Consume S Ns 0 R} end
+        end
+    """
+    num_producers = 8
+
+    def cons(head, tail):
+        return (
+            "record",
+            Literal("|"),
+            [(Literal("1"), head), (Literal("2"), tail)],
+        )
+
+    produce = [
+        "proc",
+        [Ident("l")],
+        [
+            "match",
+            Ident("l"),
+            cons(Ident("h"), Ident("t")),
+            [
+                [
+                    "send",
+                    Ident("p"),
+                    ["record", Literal("item"), [(Literal(1), Ident("h"))]],
+                ],
+                ["apply", Ident("produce"), Ident("t")],
+            ],
+            ["send", Ident("p"), Literal("done")],
+        ],
+    ]
+    count_done = [
+        "match",
+        Ident("left"),
+        cons(Ident("_"), Ident("l")),
+        [
+            "match",
+            Ident("l"),
+            cons(Ident("_"), Ident("_")),
+            [
+                "apply",
+                Ident("consume"),
+                Ident("t"),
+                Ident("l"),
+                Ident("acc"),
+                Ident("r"),
+            ],
+            ["bind", Ident("r"), Ident("acc")],
+        ],
+        ["nop"],
+    ]
+    consume = [
+        "proc",
+        [Ident("s"), Ident("left"), Ident("acc"), Ident("r")],
+        [
+            "match",
+            Ident("s"),
+            cons(Ident("h"), Ident("t")),
+            [
+                "match",
+                Ident("h"),
+                ("record", Literal("item"), [(Literal(1), Ident("v"))]),
+                [
+                    "var",
+                    Ident("a"),
+                    [
+                        [
+                            "bind",
+                            Ident("a"),
+                            ["sum", Ident("acc"), Ident("v")],
+                        ],
+                        [
+                            "apply",
+                            Ident("consume"),
+                            Ident("t"),
+                            Ident("left"),
+                            Ident("a"),
+                            Ident("r"),
+                        ],
+                    ],
+                ],
+                count_done,
+            ],
+            ["nop"],
+        ],
+    ]
+    thread = ["thread", ["apply", Ident("produce"), Ident("xs")]]
+    consumer = [
+        "var",
+        Ident("zero"),
+        [
+            ["bind", Ident("zero"), Literal(0)],
+            [
+                "var",
+                Ident("r"),
+                [
+                    "apply",
+                    Ident("consume"),
+                    Ident("s"),
+                    Ident("ns"),
+                    Ident("zero"),
+                    Ident("r"),
+                ],
+            ],
+        ],
+    ]
+
+    ast = [
+        ["newport", Ident("s"), Ident("p")],
+        ["bind", Ident("xs"), _list_ast(size // num_producers)],
+        ["bind", Ident("ns"), _list_ast(num_producers)],
+        ["bind", Ident("produce"), produce],
+        ["bind", Ident("consume"), consume],
+    ]
+    ast += [thread] * num_producers + [consumer]
+    for name in ["consume", "produce", "ns", "xs", "p", "s"]:
+        ast = ["var", Ident(name), ast]
+    return ast
+
+
+def inputs(size):
+    """Get a program summing up the lines of a file, read as a list.
+
+    The file is written to the temporary directory, with `size` lines of 1s.
+    Only the part of the list being read is kept in the store, so the memory
+    used doesn't grow with the size.
+
+    Oz equivalent (with `input` as in the AST specification):
+        local Xs Sum in
+            {Input "oz_bench_input_`size`.txt" Xs}
+            Sum = proc {$ L Acc R} ... end  % see `_sum_proc`
+            local R in {Sum Xs 0 R} end
+        end
+    """
+    path = os.path.join(gettempdir(), f"oz_bench_input_{size}.txt")
+    if not os.path.exists(path):
+        with open(path, "w") as input_file:
+            input_file.write("1\n" * size)
+
+    ast = [
+        ["input", Ident("xs"), path],
+        ["bind", Ident("sum"), _sum_proc()],
+        _sum_call(),
+    ]
+    return ["var", Ident("xs"), ["var", Ident("sum"), ast]]
+
+
+def vectors(size):
+    """Get a program summing up the squares of a vector many times.
+
+    Oz equivalent (with `vector` & `reduce` as in the AST specification):
+        local V in
+            V = {Vector `size` 2}  % a vector of `size` 2s
+            local W S in W = V * V S = {Reduce sum W} end
+            ...  % 100 times in total
+        end
+    """
+    square = [
+        "var",
+        Ident("w"),
+        [
+            "var",
+            Ident("s"),
+            [
+                ["bind", Ident("w"), ["product", Ident("v"), Ident("v")]],
+                ["bind", Ident("s"), ["reduce", "sum", Ident("w")]],
+            ],
+        ],
+    ]
+    fill = ["bind", Ident("v"), ["vector", Literal(size), Literal(2)]]
+    return ["var", Ident("v"), [fill] + [square] * 100]
+
+
+def fib(size):
+    """Get a program computing a Fibonacci number with a tabled procedure.
+
+    Without memoizing calls, the no. of calls grows exponentially with the
+    size, so compare with `--memo-size 0` only on small sizes.
+
+    Oz equivalent:
+        local N Fib in
+            N = [1 1 ... 1]  % of length `size`
+            Fib = proc {$ N R}  % tabled
+                case N of _|T then
+                    case T of _|T2 then
+                        local A B in {Fib T A} {Fib T2 B} R = A + B end
+                    else R = 1 end
+                else R = 1 end
+            end
+            local R in {Fib N R} end
+        end
+    """
+
+    def cons(tail):
+        return (
+            "record",
+            Literal("|"),
+            [(Literal("1"), Ident("_")), (Literal("2"), tail)],
+        )
+
+    recurse = [
+        "var",
+        Ident("a"),
+        [
+            "var",
+            Ident("b"),
+            [
+                ["apply", Ident("fib"), Ident("t"), Ident("a")],
+                ["apply", Ident("fib"), Ident("t2"), Ident("b")],
+                ["bind", Ident("r"), ["sum", Ident("a"), Ident("b")]],
+            ],
+        ],
+    ]
+    base = ["bind", Ident("r"), Literal(1)]
+    proc = [
+        "proc",
+        [Ident("n"), Ident("r")],
+        [
+            "match",
+            Ident("n"),
+            cons(Ident("t")),
+            ["match", Ident("t"), cons(Ident("t2")), recurse, base],
+            base,
+        ],
+        "memo",
+    ]
+    ast = [
+        ["bind", Ident("n"), _list_ast(size)],
+        ["bind", Ident("fib"), proc],
+        ["var", Ident("r"), ["apply", Ident("fib"), Ident("n"), Ident("r")]],
+    ]
+    return ["var", Ident("n"), ["var", Ident("fib"), ast]]
+
+
+def dictionaries(size):
+    """Get a program counting into a dictionary from a list many times.
+
+    Oz equivalent:
+        local Xs D Count in
+            Xs = [1 1 ... 1]  % of length 100
+            {NewDictionary D}
+            Count = proc {$ L I}
+                case L of H|T then
+                    local C C1 J in
+                        {Dictionary.condGet D I 0 C}
+                        C1 = C + H
+                        {Dictionary.put D I C1}
+                        J = I + 1
+                        {Count T J}
+                    end
+                else skip end
+            end
+            {Count Xs 0}
+            ...  % `size` times in total
+        end
+    """
+    update = [
+        [
+            "dictionary",
+            "condGet",
+            Ident("d"),
+            Ident("i"),
+            Literal(0),
+            Ident("c"),
+        ],
+        ["bind", Ident("c1"), ["sum", Ident("c"), Ident("h")]],
+        ["dictionary", "put", Ident("d"), Ident("i"), Ident("c1")],
+        ["bind", Ident("j"), ["sum", Ident("i"), Literal(1)]],
+        ["apply", Ident("count"), Ident("t"), Ident("j")],
+    ]
+    for name in ["c", "c1", "j"]:
+        update = ["var", Ident(name), update]
+    proc = [
+        "proc",
+        [Ident("l"), Ident("i")],
+        [
+            "match",
+            Ident("l"),
+            (
+                "record",
+                Literal("|"),
+                [(Literal("1"), Ident("h")), (Literal("2"), Ident("t"))],
+            ),
+            update,
+            ["nop"],
+        ],
+    ]
+    call = [
+        "var",
+        Ident("zero"),
+        [
+            ["bind", Ident("zero"), Literal(0)],
+            ["apply", Ident("count"), Ident("xs"), Ident("zero")],
+        ],
+    ]
+    ast = [
+        ["bind", Ident("xs"), _list_ast(100)],
+        ["dictionary", "new", Ident("d")],
+        ["bind", Ident("count"), proc],
+    ] + [call] * size
+    for name in ["xs", "d", "count"]:
+        ast = ["var", Ident(name), ast]
+    return ast
+
+
+BENCHMARKS = {
+    "recursion": recursion,
+    "threads": threads,
+    "ground": ground,
+    "forkjoin": forkjoin,
+    "ports": ports,
+    "fib": fib,
+    "vectors": vectors,
+    "inputs": inputs,
+    "dictionaries": dictionaries,
+}
+
+
+def _worker_counts(max_workers):
+    """Get the powers of 2 below a no. of workers, followed by that no."""
+    counts = [1]
+    while counts[-1] * 2 < max_workers:
+        counts.append(counts[-1] * 2)
+    if max_workers > 1:
+        counts.append(max_workers)
+    return counts
+
+
+def main(args):
+    """Run the main program.
+
+    Arguments:
+        args (`argparse.Namespace`): The object containing the commandline
+            arguments
+
+    """
+    ast = BENCHMARKS[args.benchmark](args.size)
+    if args.scaling:
+        modes = {
+            f"{workers} workers": ParallelInterpreter(workers=workers)
+            for workers in _worker_counts(args.workers or os.cpu_count())
+        }
+    else:
+        modes = {
+            "interpreted": Interpreter(
+                jit_threshold=None, memo_size=args.memo_size
+            ),
+            "compiled": Interpreter(
+                jit_threshold=args.jit_threshold, memo_size=args.memo_size
+            ),
+        }
+        if args.hash_cons:
+            modes["hash-consed"] = Interpreter(
+                jit_threshold=args.jit_threshold, hash_cons=True
+            )
+        if args.workers is not None:
+            modes[f"{args.workers} workers"] = ParallelInterpreter(
+                workers=args.workers
+            )
+
+    baseline = None  # the time of the first mode
+    for mode, interp in modes.items():
+        if args.memory:
+            tracemalloc.start()
+        start = perf_counter()
+        interp.run(ast)
+        elapsed = perf_counter() - start
+        result = f"{args.benchmark} ({mode}): {elapsed:.3f}s"
+        if baseline is None:
+            baseline = elapsed
+        elif args.scaling:
+            result += f", speedup: {baseline / elapsed:.2f}x"
+
+        if args.memory:
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            result += f", peak memory: {peak / 2 ** 20:.1f} MiB"
+        print(result)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Benchmarks for the Oz interpreter")
+    parser.add_argument(
+        "benchmark",
+        metavar="BENCHMARK",
+        choices=BENCHMARKS.keys(),
+        help="the name of the benchmark",
+    )
+    parser.add_argument(
+        "-n",
+        "--size",
+        type=int,
+        default=100,
+        help="the problem size for the benchmark",
+    )
+    parser.add_argument(
+        "--jit-threshold",
+        type=int,
+        default=50,
+        help="the number of calls after which procedures are compiled",
+    )
+    parser.add_argument(
+        "--memory",
+        action="store_true",
+        help="also measure the peak memory used (which slows down runs)",
+    )
+    parser.add_argument(
+        "--memo-size",
+        type=int,
+        default=1024,
+        help="the max. no. of memoized calls of tabled procedures (0 to not"
+        " memoize calls)",
+    )
+    parser.add_argument(
+        "--hash-cons",
+        action="store_true",
+        help="also run with ground records hash-consed",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="also run with this many worker processes",
+    )
+    parser.add_argument(
+        "--scaling",
+        action="store_true",
+        help="only run with 1, 2, 4, ... worker processes up to --workers (or"
+        " the no. of CPUs), printing the speedups over 1 worker",
+    )
+    main(parser.parse_args())
@@ -0,0 +1,667 @@
+#!/usr/bin/env python3
+"""Differential fuzzing of the Oz interpreter's execution modes."""
+from argparse import ArgumentParser
+from pprint import pformat
+from random import Random
+
+from ozi import (
+    PRIORITIES,
+    DeadlockError,
+    Ident,
+    Interpreter,
+    Literal,
+    Proc,
+    Record,
+    UnificationError,
+    Variable,
+)
+from ozi_mp import ParallelInterpreter
+
+# The reference, against which all other modes are compared
+REFERENCE = {"jit_threshold": None, "optimize": False}
+
+# Keyword arguments to `Interpreter` for each alternative execution mode
+MODES = {
+    "jit": {"jit_threshold": 1, "optimize": False},
+    "optimize": {"jit_threshold": None, "optimize": True},
+    "all": {"jit_threshold": 1, "optimize": True},
+    "hash-cons": {"jit_threshold": 1, "optimize": False, "hash_cons": True},
+    "parallel": {"workers": 3, "optimize": False},
+}
+
+_FAILURES = (UnificationError,)  # failures of Oz programs
+_STATUSES = {"ok", "deadlock", "failure"}  # of runs that didn't crash
+_LABELS = ["f", "g", "|"]
+_FEATURES = [Literal(1), Literal(2), Literal("a")]
+
+
+class Generator:
+    """Random generator of well-scoped Oz kernel language ASTs.
+
+    Every identifier is given a kind when declared, which is one of "int",
+    "bool", "rec", "stream", ("proc", arity, level) or ("port", literal), so
+    that most generated programs do something meaningful. Procedures can only
+    call procedures of lower levels, so that all generated programs terminate.
+    Only one literal is ever sent to each port, so that its stream doesn't
+    depend on the order in which threads send to it. Identifiers are mostly
+    read once they're bound, and only bound once, so that most programs run
+    to completion and bind many variables, instead of deadlocking or failing.
+    """
+
+    def __init__(self, rng, max_depth=4, max_stmts=4):
+        """Initialize the generator.
+
+        Args:
+            rng (`random.Random`): The source of randomness
+            max_depth (int): The maximum nesting depth of statements
+            max_stmts (int): The maximum length of sequences
+
+        """
+        self.rng = rng
+        self.max_depth = max_depth
+        self.max_stmts = max_stmts
+        self.num_idents = 0
+        self.bound = set()  # identifiers that bindings have been made for
+        # Identifiers bound by statements that always run before the current
+        # one, unlike those in branches or procedure bodies
+        self.ready = set()
+
+    def program(self, num_roots=4):
+        """Generate a program declaring the given no. of variables first."""
+        scope = {}
+        roots = [self._declare(scope) for _ in range(num_roots)]
+        # Roots may shadow each other, and only the last of them is bound
+        inits = [self._init(root, scope, 0) for root in dict.fromkeys(roots)]
+        ast = [init for init in inits if init is not None]
+        ast.append(self._seq(scope, 0, level=2))
+        for ident in reversed(roots):
+            ast = ["var", ident, ast]
+        return ast
+
+    def _declare(self, scope, kind=None):
+        """Declare a new identifier of the given kind, or a random one."""
+        if kind is None:
+            kind = self.rng.choice(["int", "int", "bool", "rec", "proc"])
+            if kind == "proc":
+                kind = ("proc", self.rng.randint(1, 2), self.rng.randint(0, 2))
+
+        # Shadow an outer identifier, but only an unbound one, as bindings are
+        # tracked by names
+        unbound = [name for name in scope if name not in self.bound]
+        if unbound and self.rng.random() < 0.1:
+            name = self.rng.choice(unbound)
+        else:
+            name = f"v{self.num_idents}"
+            self.num_idents += 1
+        scope[name] = kind
+        return Ident(name)
+
+    def _init(self, ident, scope, depth):
+        """Maybe generate a binding for a newly declared identifier.
+
+        Bindings of integers are sometimes made in a thread of their own, so
+        that other threads may have to wait for them.
+
+        Returns:
+            list: The AST of the binding, or None
+
+        """
+        kind = scope[ident.name]
+        if self.rng.random() < 0.2:
+            return None
+
+        if kind == "int":
+            init = ["bind", ident, self._int(scope, 1)]
+            self._mark([ident])
+            return ["thread", init] if self.rng.random() < 0.3 else init
+        self._mark([ident])
+        if kind == "bool":
+            return ["bind", ident, self._literal(kind)]
+        elif kind == "rec":
+            return ["bind", ident, self._record(scope)]
+        else:
+            return self._proc(ident, scope, depth)
+
+    def _pick(self, scope, kind):
+        """Pick an identifier of the given kind, or None if there's none.
+
+        Identifiers bound by the statements that run before are preferred, so
+        that fewer threads suspend.
+
+        Args:
+            scope (dict): The kinds of the identifiers in scope
+            kind (function): The predicate on the kinds of identifiers
+
+        Returns:
+            `ozi.Ident`: The identifier
+
+        """
+        names = [name for name, name_kind in scope.items() if kind(name_kind)]
+        preferred = [name for name in names if name in self.ready]
+        if preferred and self.rng.random() < 0.97:
+            names = preferred
+        return Ident(self.rng.choice(names)) if names else None
+
+    def _literal(self, kind):
+        """Generate a literal of the given kind."""
+        if kind == "bool":
+            return Literal(self.rng.random() < 0.5)
+        else:
+            return Literal(self.rng.randint(-3, 3))
+
+    def _int(self, scope, depth):
+        """Generate an integer-valued Oz value."""
+        choice = self.rng.random()
+        if choice < 0.4 or depth > 1:
+            # Only read integers that bindings have been made for, since
+            # arithmetic on unbound variables suspends the thread
+            ready = {name: scope[name] for name in scope if name in self.ready}
+            ident = self._pick(ready, lambda kind: kind == "int")
+            if ident is not None and self.rng.random() < 0.7:
+                return ident
+            return self._literal("int")
+        else:
+            oper = self.rng.choice(["sum", "product"])
+            return [
+                oper,
+                self._int(scope, depth + 1),
+                self._int(scope, depth + 1),
+            ]
+
+    def _record(self, scope):
+        """Generate a record value, with integers as the values of fields.
+
+        Fields have a single kind, as unifying values of different kinds is a
+        type error, and not a failure of unification.
+        """
+        features = self.rng.sample(_FEATURES, self.rng.randint(1, 2))
+        fields = []
+        for feat in features:
+            if self.rng.random() < 0.5:
+                value = self._pick(scope, lambda kind: kind == "int")
+            else:
+                value = None
+            fields.append((feat, value or self._int(scope, 1)))
+        return ["record", Literal(self.rng.choice(_LABELS)), fields]
+
+    def _proc(self, ident, scope, depth):
+        """Generate a binding of a procedure identifier to a procedure."""
+        _, arity, level = scope[ident.name]
+        self._mark([ident])
+        bound, ready = set(self.bound), set(self.ready)
+        inner = dict(scope)
+        # Bodies may run any no. of times, so they don't bind free identifiers
+        self.bound.update(scope)
+        args = []
+        for _ in range(arity):
+            # Marked one by one, so that arguments don't shadow each other
+            args.append(self._declare(inner, "int"))
+            self._mark(args[-1:])  # bound by the callers
+        body = self._seq(inner, depth + 1, level - 1)
+        self.bound, self.ready = bound, ready
+        return ["bind", ident, ["proc", args, body]]
+
+    def _mark(self, idents):
+        """Mark identifiers as bound by the current statement."""
+        self.bound.update(ident.name for ident in idents)
+        self.ready.update(ident.name for ident in idents)
+
+    def _end_scope(self, idents, scope):
+        """Forget that identifiers are bound, at the end of their scope.
+
+        Only those shadowing identifiers in the outer scope matter, which are
+        never bound (see `_declare`).
+        """
+        for ident in idents:
+            if ident.name in scope:
+                self.bound.discard(ident.name)
+                self.ready.discard(ident.name)
+
+    def _branch(self, scope, depth, level):
+        """Generate a sequence of statements which may not run.
+
+        Identifiers bound in it aren't ready for the statements after it.
+        """
+        ready = set(self.ready)
+        seq = self._seq(scope, depth, level)
+        self.ready = ready
+        return seq
+
+    def _seq(self, scope, depth, level):
+        """Generate a sequence of statements.
+
+        Args:
+            scope (dict): The kinds of the identifiers in scope
+            depth (int): The current nesting depth
+            level (int): The maximum level of procedures that can be called
+
+        Returns:
+            list: The AST of the sequence
+
+        """
+        num_stmts = self.rng.randint(1, self.max_stmts)
+        stmts = [self._stmt(scope, depth, level) for _ in range(num_stmts)]
+        return stmts[0] if len(stmts) == 1 else stmts
+
+    def _stmt(self, scope, depth, level):
+        """Generate a statement."""
+        choices = ["bind", "bind", "bind"]
+        if depth < self.max_depth:
+            choices += ["var", "var", "conditional", "match", "thread"]
+            choices += ["proc", "apply", "apply"]
+            choices += ["port", "send", "send", "receive"]
+        choice = self.rng.choice(choices)
+
+        if choice == "var":
+            inner = dict(scope)
+            ident = self._declare(inner)
+            init = self._init(ident, inner, depth + 1)
+            body = self._seq(inner, depth + 1, level)
+            self._end_scope([ident], scope)
+            if init is not None:
+                body = [init, body]
+            return ["var", ident, body]
+
+        elif choice == "conditional":
+            cond = self._pick(scope, lambda kind: kind == "bool")
+            if cond is not None:
+                return [
+                    "conditional",
+                    cond,
+                    self._branch(scope, depth + 1, level),
+                    self._branch(scope, depth + 1, level),
+                ]
+
+        elif choice == "match":
+            ident = self._pick(scope, lambda kind: kind == "rec")
+            if ident is not None:
+                inner = dict(scope)
+                features = self.rng.sample(_FEATURES, self.rng.randint(1, 2))
+                fields = []
+                for feat in features:
+                    fields.append((feat, self._declare(inner, "int")))
+                    self._mark([fields[-1][1]])  # bound by matching
+                pattern = ["record", Literal(self.rng.choice(_LABELS)), fields]
+                matched = self._branch(inner, depth + 1, level)
+                self._end_scope([ident for _, ident in fields], scope)
+                return [
+                    "match",
+                    ident,
+                    pattern,
+                    matched,
+                    self._branch(scope, depth + 1, level),
+                ]
+
+        elif choice == "thread":
+            thread = ["thread", self._seq(scope, depth + 1, level)]
+            if self.rng.random() < 0.5:
+                thread.append(self.rng.choice(PRIORITIES))
+            return thread
+
+        elif choice == "proc":
+            # A new procedure, as procedures can't be bound again
+            inner = dict(scope)
+            kind = (
+                "proc",
+                self.rng.randint(1, 2),
+                self.rng.randint(0, max(level, 0)),
+            )
+            ident = self._declare(inner, kind)
+            proc = self._proc(ident, inner, depth + 1)
+            body = self._seq(inner, depth + 1, level)
+            self._end_scope([ident], scope)
+            return ["var", ident, [proc, body]]
+
+        elif choice == "port":
+            inner = dict(scope)
+            stream = self._declare(inner, "stream")
+            self._mark([stream])
+            port = self._declare(inner, ("port", self._literal("int")))
+            self._mark([port])
+            body = self._seq(inner, depth + 1, level)
+            self._end_scope([stream, port], scope)
+            return [
+                "var",
+                stream,
+                ["var", port, [["newport", stream, port], body]],
+            ]
+
+        elif choice == "send":
+            ident = self._pick(scope, lambda kind: kind[0] == "port")
+            if ident is not None:
+                return ["send", ident, scope[ident.name][1]]
+
+        elif choice == "receive":
+            ident = self._pick(scope, lambda kind: kind == "stream")
+            if ident is not None:
+                inner = dict(scope)
+                head = self._declare(inner, "int")
+                self._mark([head])
+                tail = self._declare(inner, "stream")
+                self._mark([tail])
+                pattern = [
+                    "record",
+                    Literal("|"),
+                    [(Literal("1"), head), (Literal("2"), tail)],
+                ]
+                matched = self._branch(inner, depth + 1, level)
+                self._end_scope([head, tail], scope)
+                return [
+                    "match",
+                    ident,
+                    pattern,
+                    matched,
+                    self._branch(scope, depth + 1, level),
+                ]
+
+        elif choice == "apply":
+            # Only procedures that are bound, as waiting for the others mostly
+            # deadlocks
+            ready = {name: scope[name] for name in scope if name in self.ready}
+            ident = self._pick(
+                ready, lambda kind: kind[0] == "proc" and kind[2] <= level
+            )
+            if ident is not None:
+                _, arity, _ = scope[ident.name]
+                args = []
+                for _ in range(arity):
+                    arg = self._pick(scope, lambda kind: kind == "int")
+                    if arg is None:
+                        break
+                    args.append(arg)
+                else:
+                    return ["apply", ident, *args]
+
+        # Fall back to a binding
+        kind = self.rng.choice(["int", "int", "bool", "rec"])
+        targets = scope
+        if self.rng.random() < 0.99:  # mostly avoid conflicting re-bindings
+            targets = {
+                name: scope[name] for name in scope if name not in self.bound
+            }
+        ident = self._pick(targets, lambda ident_kind: ident_kind == kind)
+        declared = ident is None
+        if declared:  # bind a new identifier, so that the store still grows
+            ident = self._declare(dict(scope), kind)
+
+        if kind == "int":
+            value = self._int(scope, 0)
+        elif kind == "bool":
+            value = self._pick(scope, lambda ident_kind: ident_kind == kind)
+            if value is None or self.rng.random() < 0.5:
+                value = self._literal(kind)
+        else:
+            value = self._record(scope)
+        # Only after the value, which mustn't read the identifier itself
+        self._mark([ident])
+        if declared:
+            self._end_scope([ident], scope)
+            return ["var", ident, ["bind", ident, value]]
+        return ["bind", ident, value]
+
+
+def canonical_store(sas, rounds):
+    """Get labels of the variables of a SAS, up to renaming.
+
+    Labels are refined iteratively from the contents of each variable's class
+    and the labels of the classes that they refer to, so structurally equal
+    stores get equal labels after the same no. of rounds. Bound variables are
+    labelled by their values alone, as whether they're in one class or were
+    bound to equal values separately (eg. by different workers) can't be
+    told apart by Oz programs.
+
+    Args:
+        sas (list): The single-assignment store
+        rounds (int): The no. of rounds of refinement
+
+    Returns:
+        list: The labels of the variables, after each round
+
+    """
+    classes = list({id(eq_class): eq_class for eq_class in sas}.values())
+
+    def value_label(value, labels):
+        if type(value) is Variable:
+            return labels[id(sas[value.name])]
+        elif type(value) is Literal:
+            return ("lit", type(value.value).__name__, repr(value.value))
+        elif type(value) is Record:
+            fields = sorted(
+                (repr(feat), value_label(val, labels))
+                for feat, val in value.fields.items()
+            )
+            return ("rec", repr(value.literal), tuple(fields))
+        elif type(value) is Proc:
+            # The optimizer may drop free identifiers from procedure bodies,
+            # so contextual environments can differ between modes
+            return ("proc", len(value.args))
+        else:
+            return (type(value).__name__,)
+
+    labels = {id(eq_class): 0 for eq_class in classes}
+    history = []
+    for _ in range(rounds):
+        labels = {
+            id(eq_class): hash(
+                value_label(eq_class.value, labels)
+                if eq_class.is_bound()
+                else len(eq_class.vars)
+            )
+            for eq_class in classes
+        }
+        history.append(sorted(labels[id(eq_class)] for eq_class in sas))
+    return history
+
+
+def stores_match(lhs, rhs):
+    """Check whether two stores are equal up to renaming of variables."""
+    if len(lhs) != len(rhs):
+        return False
+    rounds = 1 + max(  # enough for the labels to be stable
+        len({id(eq_class) for eq_class in lhs}),
+        len({id(eq_class) for eq_class in rhs}),
+    )
+    return canonical_store(lhs, rounds) == canonical_store(rhs, rounds)
+
+
+def run_mode(ast, kwargs):
+    """Run a program in an execution mode.
+
+    Args:
+        ast (list): The program's AST
+        kwargs (dict): The keyword arguments to `Interpreter`, or to
+            `ozi_mp.ParallelInterpreter` if they include "workers"
+
+    Returns:
+        str: The termination status, which is one of "ok", "deadlock",
+            "failure" (for failures of unification) or the name of any other
+            exception raised, which is a crash
+        list: The final SAS, or the SAS at the point of failure
+
+    """
+    if "workers" in kwargs:
+        interp = ParallelInterpreter(**kwargs)
+    else:
+        interp = Interpreter(**kwargs)
+    try:
+        interp.run(ast)
+    except DeadlockError:
+        status = "deadlock"
+    except _FAILURES:
+        status = "failure"
+    except Exception as ex:
+        status = type(ex).__name__
+    else:
+        status = "ok"
+    return status, interp.sas
+
+
+def mismatch(ast, modes):
+    """Check a program in all the given modes against the reference.
+
+    Args:
+        ast (list): The program's AST
+        modes (dict): The keyword arguments to `Interpreter` for each mode
+
+    Returns:
+        str: The description of the first mismatch, or None if there's none
+
+    """
+    ref_status, ref_sas = run_mode(ast, REFERENCE)
+    if ref_status not in _STATUSES:
+        return f"reference: crashed with {ref_status}"
+    # Stores at the point of a failure depend on the interleaving of threads,
+    # which differs between modes, so they're only compared without threads
+    compare = ref_status != "failure" or not _has_threads(ast)
+    for name, kwargs in modes.items():
+        status, sas = run_mode(ast, kwargs)
+        if status != ref_status:
+            return f"{name}: status {status}, reference: {ref_status}"
+        elif status == "failure" and "workers" in kwargs:
+            continue  # the store isn't gathered from the workers on errors
+        elif compare and not stores_match(ref_sas, sas):
+            return f"{name}: final stores differ"
+    return None
+
+
+def _has_threads(stmt):
+    """Check whether a statement has any thread statements, at any depth."""
+    if type(stmt) is not list:  # identifiers, literals & fields
+        return False
+    return stmt[:1] == ["thread"] or any(_has_threads(sub) for sub in stmt)
+
+
+def _reductions(stmt):
+    """Generate ASTs that are one step smaller than the given statement."""
+    if stmt[0] == "nop":
+        return
+
+    elif type(stmt[0]) is list:
+        for i in range(len(stmt)):
+            rest = stmt[:i] + stmt[i + 1 :]
+            yield rest[0] if len(rest) == 1 else rest
+        for i, sub_stmt in enumerate(stmt):
+            for reduced in _reductions(sub_stmt):
+                yield stmt[:i] + [reduced] + stmt[i + 1 :]
+        return
+
+    yield ["nop"]
+    if stmt[0] == "var":
+        for reduced in _reductions(stmt[2]):
+            yield [stmt[0], stmt[1], reduced]
+
+    elif stmt[0] == "conditional":
+        yield stmt[2]
+        yield stmt[3]
+        for i in [2, 3]:
+            for reduced in _reductions(stmt[i]):
+                yield stmt[:i] + [reduced] + stmt[i + 1 :]
+
+    elif stmt[0] == "match":
+        yield stmt[3]
+        yield stmt[4]
+        for i in [3, 4]:
+            for reduced in _reductions(stmt[i]):
+                yield stmt[:i] + [reduced] + stmt[i + 1 :]
+
+    elif stmt[0] == "thread":
+        yield stmt[1]
+        for reduced in _reductions(stmt[1]):
+            yield [stmt[0], reduced, *stmt[2:]]
+
+    elif stmt[0] == "bind" and type(stmt[2]) is list and stmt[2][0] == "proc":
+        proc = stmt[2]
+        for reduced in _reductions(proc[2]):
+            yield [stmt[0], stmt[1], [proc[0], proc[1], reduced]]
+
+
+def minimize(ast, modes):
+    """Greedily shrink a program while it still shows a mismatch.
+
+    Candidates that the reference can't run as Oz programs, such as ones
+    with identifiers that are out of scope, are skipped.
+
+    Args:
+        ast (list): The program's AST, which must show a mismatch
+        modes (dict): The keyword arguments to `Interpreter` for each mode
+
+    Returns:
+        list: The minimized AST
+
+    """
+    shrunk = True
+    while shrunk:
+        shrunk = False
+        for candidate in _reductions(ast):
+            if run_mode(candidate, REFERENCE)[0] not in _STATUSES:
+                continue
+            if mismatch(candidate, modes) is not None:
+                ast = candidate
+                shrunk = True
+                break
+    return ast
+
+
+def main(args):
+    """Run the main program.
+
+    Arguments:
+        args (`argparse.Namespace`): The object containing the commandline
+            arguments
+
+    """
+    modes = {name: MODES[name] for name in args.modes}
+    rng = Random(args.seed)
+    failures = 0
+
+    for i in range(args.num_programs):
+        ast = Generator(rng, max_depth=args.max_depth).program()
+        problem = mismatch(ast, modes)
+        if problem is None:
+            continue
+
+        failures += 1
+        print(f"program {i}: {problem}")
+        if not args.no_minimize:
+            ast = minimize(ast, modes)
+            print(f"minimized: {mismatch(ast, modes)}")
+        print(pformat(ast))
+
+    print(f"{failures}/{args.num_programs} programs mismatched")
+    return failures
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(
+        description="Differential fuzzing of the Oz interpreter's modes"
+    )
+    parser.add_argument(
+        "-n",
+        "--num-programs",
+        type=int,
+        default=200,
+        help="the no. of programs to generate",
+    )
+    parser.add_argument(
+        "-s", "--seed", type=int, default=0, help="the random seed"
+    )
+    parser.add_argument(
+        "--max-depth",
+        type=int,
+        default=4,
+        help="the maximum nesting depth of generated statements",
+    )
+    parser.add_argument(
+        "-m",
+        "--modes",
+        nargs="+",
+        choices=MODES.keys(),
+        default=list(MODES.keys()),
+        help="the execution modes to compare against the reference",
+    )
+    parser.add_argument(
+        "--no-minimize",
+        action="store_true",
+        help="print mismatching programs as generated",
+    )
+    exit(1 if main(parser.parse_args()) else 0)
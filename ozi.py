@@ -1,15 +1,126 @@
 """Interpreter for the Oz kernel language's AST."""
+import copy
+import csv
 import logging
-from collections import namedtuple
+import mmap
+import re
+import reprlib
+import struct
+import sys
+import tracemalloc
+from bisect import bisect_right
+from collections import Counter, OrderedDict, deque, namedtuple
 from copy import deepcopy
-from pprint import pformat
-from queue import Queue
+from weakref import WeakValueDictionary
+
+try:
+    import numpy as np
+except ImportError:  # vectors aren't supported without NumPy
+    np = None
 
 Literal = namedtuple("Literal", ["value"])
 Ident = namedtuple("Identifier", ["name"])
 Variable = namedtuple("Variable", ["name"])
 Record = namedtuple("Record", ["literal", "fields"])
-Proc = namedtuple("Procedure", ["args", "contents", "ctxenv"])
+Proc = namedtuple("Procedure", ["args", "contents", "ctxenv", "tabled"])
+Port = namedtuple("Port", ["name"])
+Dictionary = namedtuple("Dictionary", ["name"])
+Array = namedtuple("Array", ["name"])
+
+
+class Vector(namedtuple("Vector", ["array"])):
+    """Numeric vector value, holding an immutable NumPy array."""
+
+    __slots__ = ()
+
+    def __repr__(self):
+        """Get a summary of this vector, as its elements can be many."""
+        return f"Vector(length={len(self.array)}, dtype={self.array.dtype})"
+
+
+# Types of computed values
+_VALUE_TYPES = {
+    Literal,
+    Variable,
+    Record,
+    Proc,
+    Port,
+    Vector,
+    Dictionary,
+    Array,
+}
+
+_JIT_THRESHOLD = 50  # calls after which a procedure body is compiled
+_MAX_JIT_DEPTH = 64  # nesting of compiled calls before falling back
+# Attributes of the interpreter used by compiled code, with their local names
+_COMPILED_ATTRS = (
+    ("unify", "unify"),
+    ("bind", "_bind"),
+    ("invoke", "_invoke"),
+    ("compiled_procs", "_compiled"),
+    ("new_port", "_new_port"),
+    ("port_send", "_port_send"),
+    ("entity_op", "_entity_op"),
+)
+_MEMO_SIZE = 1024  # results of tabled procedures kept, by default
+_COLLECT_MIN = 1 << 16  # store growth between collections, with inputs
+
+# Thread priorities, from highest to lowest, and the default share of steps
+# for each, like in Mozart (where each level gets 10x the time of the next)
+PRIORITIES = ("high", "medium", "low")
+PRIORITY_SHARES = {"high": 100, "medium": 10, "low": 1}
+
+# Kinds of events in execution traces, which are recorded in binary as the
+# kind, the tick, the no. of the running thread and an argument, whose meaning
+# depends on the kind (see `TraceRecorder`)
+TRACE_EVENTS = ("switch", "spawn", "suspend", "wake", "bind", "finish", "end")
+_SWITCH, _SPAWN, _SUSPEND, _WAKE, _BIND, _FINISH, _END = range(7)
+_TRACE_MAGIC = b"OZTRACE1"
+_TRACE_EVENT = struct.Struct("<BQIQ")
+_TRACE_BUFFER = 1 << 16  # bytes of events buffered before being written
+
+# The label and features of the cons cells of lists, such as port streams
+_CONS = Literal("|")
+_HEAD = Literal("1")
+_TAIL = Literal("2")
+
+_DESCRIBE_DEPTH = 64  # nesting of values shown when describing variables
+_LOG_DEPTH = 3  # nesting of values & ASTs shown in log messages
+
+# Statements which wait for (some of) their operands to be bound
+_SUSPENDABLE = {
+    "bind",
+    "conditional",
+    "match",
+    "apply",
+    "send",
+    "dictionary",
+    "array",
+}
+
+# Statements with effects that memoized calls would skip, which tabled
+# procedures can't have
+_IMPURE = {"newport", "send", "dictionary", "array"}
+
+# Operations on dictionaries & arrays, with the kinds of their arguments:
+# the "entity" operated on & "operand"s, which must be bound, "value"s, which
+# needn't be, and the "result", which is bound to what the operation gives
+_ENTITY_OPS = {
+    ("dictionary", "new"): ("result",),
+    ("dictionary", "put"): ("entity", "operand", "value"),
+    ("dictionary", "get"): ("entity", "operand", "result"),
+    ("dictionary", "condGet"): ("entity", "operand", "value", "result"),
+    ("dictionary", "remove"): ("entity", "operand"),
+    ("dictionary", "size"): ("entity", "result"),
+    ("array", "new"): ("operand", "operand", "value", "result"),
+    ("array", "put"): ("entity", "operand", "value"),
+    ("array", "get"): ("entity", "operand", "result"),
+    ("array", "condGet"): ("entity", "operand", "value", "result"),
+    ("array", "size"): ("entity", "result"),
+}
+
+# NumPy functions for the reductions over vectors
+_REDUCTIONS = {"sum": "sum", "product": "prod", "min": "min", "max": "max"}
 
 
 class UnificationError(Exception):
@@ -21,7 +132,11 @@ class DeadlockError(Exception):
 
 
 class UnboundVariableError(Exception):
-    """Exception for unbound variables."""
+    """Exception for unbound variables.
+
+    Statements are only run once their operands are bound, so this is only
+    raised on errors in the interpreter.
+    """
 
     def __init__(self, message, var):
         """Store the variable that is unbound."""
@@ -32,10 +147,13 @@ class UnboundVariableError(Exception):
 class _EqClass:
     """Equivalence class for the single-assignment store."""
 
+    __slots__ = ("vars", "value", "waiters")
+
     def __init__(self, var):
         """Initialize the class with the given unbound variable."""
         self.vars = {var}
         self.value = None
+        self.waiters = None  # threads parked on this class, if any
 
     def __repr__(self):
         """Get a string representation for printing this equivalence class."""
@@ -46,28 +164,1604 @@ class _EqClass:
         return self.value is not None
 
 
+class _GroundFields(dict):
+    """Fields of a hash-consed ground record, shared by all equal records.
+
+    A ground record has only literals and other ground records as its values.
+    Structurally equal ground records share one of these, so that checking
+    them for equality is just an identity check. They are only kept alive by
+    the records using them, so that unused ones are evicted from the table.
+    """
+
+    __slots__ = ("__weakref__",)
+
+
+def _literal_key(literal):
+    """Get a key for a literal, which tells apart `1`, `1.0` and `True`."""
+    return type(literal.value), literal.value
+
+
 class _Thread:
-    """Class for threads with editable attributes."""
+    """Class for threads, with as little memory per thread as possible.
 
-    def __init__(self, num, stack):
-        """Create a thread."""
+    A thread's continuation is its top frame, with a stack of the frames below
+    it that is only allocated once a second frame is pushed. Threads that are
+    suspended aren't kept in any run queue, but are parked on the equivalence
+    class of the variable that they wait for, until it's bound.
+    """
+
+    __slots__ = ("num", "priority", "tick", "frame", "stack")
+
+    def __init__(self, num, frame, priority="medium"):
+        """Create a thread starting with the given frame."""
         self.num = num  # kept for debugging purposes
-        self.stack = stack
-        self.suspension = None  # the variable this thread is suspended on
-        self.tick = 0  # time when this thread was last checked/updated
+        self.priority = priority
+        self.tick = 0  # time when this thread was last put in a run queue
+        self.frame = frame  # the top frame, or None once finished
+        self.stack = None
+
+    def frames(self):
+        """Get a list of the frames of this thread, from the bottom up."""
+        if self.frame is None:
+            return []
+        return (self.stack or []) + [self.frame]
+
+    def push(self, frames):
+        """Push the given frames (from the bottom up) on this thread."""
+        if not frames:
+            return
+        if self.frame is not None or len(frames) > 1:
+            if self.stack is None:
+                self.stack = []
+            if self.frame is not None:
+                self.stack.append(self.frame)
+            self.stack.extend(frames[:-1])
+        self.frame = frames[-1]
+
+
+class _Scheduler:
+    """Run queues of threads, with a weighted share of steps per priority.
+
+    Priorities are picked by smooth weighted round-robin: every priority with
+    waiting threads earns credit equal to its share in every step, and the
+    one with the most credit runs a thread and pays back the total earned.
+    Thus, each priority gets its share of steps, spread out evenly, and
+    priorities without waiting threads don't hoard credit.
+
+    Attributes:
+        tick (int): The time counter, which counts steps run
+        parked (int): The no. of threads waiting for variables to be bound
+        thr_count (int): The no. of threads created, for debugging
+        spawned (dict): The initial frames of threads by the IDs of the
+            statements spawning them, which are shared when envs are same
+        stats (dict): Per-priority statistics, which are the no. of steps run,
+            the maximum and total run queue lengths seen in these steps, and
+            the maximum and total latencies (in ticks from being put in the
+            queue till being run)
+
+    """
+
+    def __init__(self, shares=None):
+        """Initialize empty run queues.
+
+        Args:
+            shares (dict): The relative share of steps for each priority, with
+                the defaults in `PRIORITY_SHARES`
+
+        """
+        self.shares = dict(PRIORITY_SHARES)
+        if shares is not None:
+            self.shares.update(shares)
+        shares = self.shares.values()
+        if set(self.shares) != set(PRIORITIES) or min(shares) < 1:
+            raise ValueError(f"invalid priority shares: {self.shares}")
+
+        self.queues = {priority: deque() for priority in PRIORITIES}
+        self.size = 0
+        self.tick = 0
+        self.parked = 0
+        self.thr_count = 0
+        self.spawned = {}
+        self.credits = {priority: 0 for priority in PRIORITIES}
+        self.stats = {
+            priority: {
+                "steps": 0,
+                "max_queue": 0,
+                "total_queue": 0,
+                "max_latency": 0,
+                "total_latency": 0,
+            }
+            for priority in PRIORITIES
+        }
+
+    def __len__(self):
+        """Get the no. of threads in the run queues."""
+        return self.size
+
+    def threads(self):
+        """Get a list of the threads in the run queues."""
+        return [thr for queue in self.queues.values() for thr in queue]
+
+    def put(self, thread, tick):
+        """Put a thread in the run queue of its priority at the given tick."""
+        thread.tick = tick
+        self.queues[thread.priority].append(thread)
+        self.size += 1
+
+    def get(self, tick):
+        """Get the next thread to run at the given tick."""
+        queues = self.queues
+        waiting = [pri for pri in PRIORITIES if queues[pri]]
+        if len(waiting) == 1:  # no need to share steps
+            priority = waiting[0]
+        else:
+            for priority in waiting:
+                self.credits[priority] += self.shares[priority]
+            priority = max(waiting, key=self.credits.get)
+            self.credits[priority] -= sum(self.shares[pri] for pri in waiting)
+
+        queue = queues[priority]
+        stats = self.stats[priority]
+        stats["steps"] += 1
+        stats["max_queue"] = max(stats["max_queue"], len(queue))
+        stats["total_queue"] += len(queue)
+
+        thread = queue.popleft()
+        self.size -= 1
+        latency = tick - thread.tick
+        stats["max_latency"] = max(stats["max_latency"], latency)
+        stats["total_latency"] += latency
+        return thread
+
+    def summary(self):
+        """Get the per-priority means and maxima of queue lengths & latencies.
+
+        Returns:
+            dict: The no. of steps, and the mean and maximum run queue length
+                and latency, for each priority
+
+        """
+        summary = {}
+        for priority, stats in self.stats.items():
+            steps = max(stats["steps"], 1)
+            summary[priority] = {
+                "steps": stats["steps"],
+                "mean_queue": stats["total_queue"] / steps,
+                "max_queue": stats["max_queue"],
+                "mean_latency": stats["total_latency"] / steps,
+                "max_latency": stats["max_latency"],
+            }
+        return summary
+
+
+class _ReplayScheduler(_Scheduler):
+    """Scheduler running threads in the order recorded in a trace.
+
+    Priorities are ignored, as the recorded order already follows them.
+    """
+
+    def __init__(self, switches, shares=None):
+        """Initialize empty run queues.
+
+        Args:
+            switches (list): The ticks at which the running thread changed,
+                with the no. of the thread run from then on
+            shares (dict): The relative share of steps for each priority
+
+        """
+        super().__init__(shares)
+        self.switches = deque(switches)
+        self.ready = {}  # threads that can run, by their numbers
+        self.current = 0  # the no. of the thread to be run, first the main one
+
+    def threads(self):
+        """Get a list of the threads that can run."""
+        return list(self.ready.values())
+
+    def put(self, thread, tick):
+        """Make a thread ready to run."""
+        thread.tick = tick
+        self.ready[thread.num] = thread
+        self.size += 1
+
+    def get(self, tick):
+        """Get the thread that was run at the given tick."""
+        if self.switches and self.switches[0][0] == tick:
+            self.current = self.switches.popleft()[1]
+        thread = self.ready.pop(self.current, None)
+        if thread is None:
+            raise ValueError(
+                f"thread {self.current} can't run at tick {tick}, so this run"
+                " differs from the traced one"
+            )
+        self.size -= 1
+        self.stats[thread.priority]["steps"] += 1
+        return thread
+
+
+class MemoryReport:
+    """Time series of memory usage of an interpreter run.
+
+    Every sample has the tick at which it was taken, the size of the SAS, the
+    no. of live threads, the maximum and total depths of their stacks, the
+    total no. of entries in their environments, and the bytes allocated by
+    each subsystem of the interpreter as traced by `tracemalloc`.
+
+    Attributes:
+        interval (int): The no. of ticks between samples
+        samples (list): The samples, as dicts with `FIELDS` as the keys
+        high_water (dict): The maximum of each of the SAS size, live thread
+            count and total environment entries over the run
+        stack_high_water (dict): The maximum stack depth of each thread, with
+            thread numbers as the keys
+
+    """
+
+    SUBSYSTEMS = ["store", "environments", "stacks", "values", "code", "other"]
+    FIELDS = [
+        "tick",
+        "sas",
+        "threads",
+        "max_stack",
+        "total_stack",
+        "env_entries",
+    ] + [f"{subsystem}_bytes" for subsystem in SUBSYSTEMS]
+
+    # Subsystems to which memory allocated inside functions of this module
+    # belongs, by qualified function name
+    _FUNC_SUBSYSTEMS = {
+        "_EqClass.__init__": "store",
+        "Interpreter._alloc_var": "store",
+        "Interpreter._unify_vars": "store",
+        "Interpreter.unify": "store",
+        "Interpreter._compute": "values",
+        "Interpreter._intern": "values",
+        "Interpreter._port_send": "values",
+        "Interpreter._entity_op": "values",
+        "Interpreter._unify_values": "values",
+        "Interpreter._call": "environments",
+        "_arith": "values",
+        "_vector": "values",
+        "_frame": "stacks",
+        "_Thread.__init__": "stacks",
+        "Interpreter._exec_stmt": "stacks",
+        "Interpreter._schedule": "stacks",
+        "Interpreter.run": "stacks",
+    }
+
+    def __init__(self, interval=100):
+        """Initialize an empty report."""
+        self.interval = interval
+        self.samples = []
+        self.high_water = {"sas": 0, "threads": 0, "env_entries": 0}
+        self.stack_high_water = {}
+        self.last_tick = 0  # time of the last observation
+        self._next_tick = 0
+        self._func_lines = None  # first lines of functions in this module
+        self._func_names = None  # qualified names of those functions
+        # Subsystems of the lines of allocation tracebacks, or None for lines
+        # outside the interpreter, keyed by file name & line no.
+        self._line_subsystems = {}
+
+    def observe(self, tick, sas, num_threads, thread, get_threads):
+        """Update the high-water marks after a thread has run a step.
+
+        A sample is also taken if it's due.
+
+        Args:
+            tick (int): The current time
+            sas (list): The single-assignment store
+            num_threads (int): The no. of threads that are still live
+            thread (`_Thread`): The thread that ran in this step
+            get_threads (function): The function to get a list of the threads
+                that are still live, which is only called for samples
+
+        """
+        self.last_tick = tick
+        self.high_water["sas"] = max(self.high_water["sas"], len(sas))
+        self.high_water["threads"] = max(
+            self.high_water["threads"], num_threads
+        )
+        self.stack_high_water[thread.num] = max(
+            self.stack_high_water.get(thread.num, 0), len(thread.frames())
+        )
+        if tick >= self._next_tick:
+            self.sample(tick, sas, get_threads())
+
+    def sample(self, tick, sas, threads):
+        """Take a sample of the memory usage."""
+        self._next_tick = tick + self.interval
+        stacks = [thread.frames() for thread in threads]
+        depths = [len(stack) for stack in stacks]
+
+        envs = {}  # keep only one copy of shared environments
+        for stack in stacks:
+            for _, _, env in stack:
+                envs[id(env)] = env
+        env_entries = sum(len(env) for env in envs.values())
+        self.high_water["env_entries"] = max(
+            self.high_water["env_entries"], env_entries
+        )
+
+        sample = {
+            "tick": tick,
+            "sas": len(sas),
+            "threads": len(threads),
+            "max_stack": max(depths, default=0),
+            "total_stack": sum(depths),
+            "env_entries": env_entries,
+        }
+        sizes = self._attribute(tracemalloc.take_snapshot())
+        for subsystem in self.SUBSYSTEMS:
+            sample[f"{subsystem}_bytes"] = sizes[subsystem]
+        self.samples.append(sample)
+
+    def _subsystem(self, traceback):
+        """Get the subsystem to which an allocation belongs."""
+        # Frames are checked starting from the most recent one
+        for frame in reversed(traceback):
+            key = frame.filename, frame.lineno
+            if key in self._line_subsystems:
+                subsystem = self._line_subsystems[key]
+            else:
+                subsystem = self._line_subsystem(*key)
+                self._line_subsystems[key] = subsystem
+            if subsystem is not None:
+                return subsystem
+        return "other"
+
+    def _line_subsystem(self, filename, lineno):
+        """Get the subsystem of a line, or None if outside the interpreter."""
+        if self._func_lines is None:
+            func_lines = {}
+            module = sys.modules[__name__]
+            for name, obj in vars(module).items():
+                funcs = [obj]
+                if isinstance(obj, type) and obj.__module__ == __name__:
+                    funcs = list(vars(obj).values())
+                for func in funcs:
+                    code = getattr(func, "__code__", None)
+                    if code is None or code.co_filename != __file__:
+                        continue
+                    func_lines[code.co_firstlineno] = func.__qualname__
+            # A line belongs to the last function starting before it
+            self._func_lines = sorted(func_lines)
+            self._func_names = [func_lines[line] for line in self._func_lines]
+
+        if filename == copy.__file__:
+            return "environments"  # only environments are deep-copied
+        elif filename.startswith("<compiled"):
+            return "code"
+        elif filename == __file__:
+            index = bisect_right(self._func_lines, lineno) - 1
+            if index < 0:
+                return "other"
+            name = self._func_names[index]
+            if name.startswith(("_ProcCompiler", "_Optimizer")):
+                return "code"
+            return self._FUNC_SUBSYSTEMS.get(name, "other")
+        return None
+
+    def _attribute(self, snapshot):
+        """Get the bytes allocated by each subsystem in a snapshot."""
+        sizes = Counter({subsystem: 0 for subsystem in self.SUBSYSTEMS})
+        # Most allocations share their tracebacks, so they're grouped first
+        for stat in snapshot.statistics("traceback"):
+            sizes[self._subsystem(stat.traceback)] += stat.size
+        return sizes
+
+    def write_csv(self, file):
+        """Write the samples as CSV to the given file object."""
+        writer = csv.DictWriter(file, fieldnames=self.FIELDS)
+        writer.writeheader()
+        writer.writerows(self.samples)
+
+
+class _InputSource:
+    """Memory-mapped file, read as a list of items on demand.
+
+    Items are either lines or fixed-width records, which are parsed as
+    integers or floats where possible, and are strings otherwise (or bytes,
+    if they aren't UTF-8).
+    """
+
+    def __init__(self, path, width=None):
+        """Map the file into memory.
+
+        Args:
+            path (str): The path to the file
+            width (int): The no. of bytes in each record, or None if items are
+                lines
+
+        """
+        self.width = width
+        self._file = open(path, "rb")
+        try:
+            self._map = mmap.mmap(
+                self._file.fileno(), 0, access=mmap.ACCESS_READ
+            )
+        except ValueError:  # empty files can't be mapped
+            self._map = b""
+
+    def read(self, offset):
+        """Read the item at an offset.
+
+        Args:
+            offset (int): The offset of the item in the file
+
+        Returns:
+            tuple: The item as a literal and the offset of the next item, or
+                None if there are no more items
+
+        """
+        size = len(self._map)
+        if offset >= size:
+            return None
+        elif self.width is not None:
+            end = next_offset = min(offset + self.width, size)
+        else:
+            end = self._map.find(b"\n", offset)
+            if end < 0:  # the last line has no newline
+                end = size
+            next_offset = end + 1
+        return _parse_item(self._map[offset:end]), next_offset
+
+    def close(self):
+        """Unmap & close the file."""
+        if type(self._map) is mmap.mmap:
+            self._map.close()
+        self._file.close()
+
+
+def _parse_item(raw):
+    """Parse an item of an input file into a literal."""
+    try:
+        text = raw.decode().strip()
+    except UnicodeDecodeError:
+        return Literal(raw)
+    for kind in int, float:
+        try:
+            return Literal(kind(text))
+        except ValueError:
+            pass
+    return Literal(text)
+
+
+class TraceRecorder:
+    """Recorder of the events of an interpreter run into a binary file.
+
+    Every event is recorded with the tick at which it happened and the no. of
+    the thread running then. The argument of an event depends on its kind:
+
+    * "switch": A different thread is run from this tick on (no argument).
+    * "spawn": A thread is created, with its no. as the argument.
+    * "suspend": The thread suspends on the SAS variable in the argument.
+    * "wake": The thread binds a variable that the thread in the argument
+        waits for.
+    * "bind": The thread binds the SAS variable in the argument, which is the
+        lowest one in its equivalence class.
+    * "finish": The thread completes (no argument).
+    * "end": The run ends, with the no. of threads left suspended as the
+        argument.
+
+    Events are buffered, and are only written in large chunks.
+
+    Attributes:
+        tick (int): The current time
+        thread (int): The no. of the thread running now
+
+    """
+
+    def __init__(self, file):
+        """Start a trace in the given file object, opened in binary mode."""
+        self.file = file
+        self.tick = 0
+        self.thread = 0
+        self._buffer = bytearray(_TRACE_MAGIC)
+
+    def step(self, tick, thread):
+        """Record that the given thread runs a step at the given tick."""
+        self.tick = tick
+        if thread != self.thread:
+            self.thread = thread
+            self.record(_SWITCH)
+
+    def record(self, kind, arg=0):
+        """Record an event of the running thread, by its kind's index."""
+        self._buffer += _TRACE_EVENT.pack(kind, self.tick, self.thread, arg)
+        if len(self._buffer) >= _TRACE_BUFFER:
+            self.flush()
+
+    def flush(self):
+        """Write the buffered events to the file."""
+        self.file.write(self._buffer)
+        self._buffer.clear()
+
+
+def read_trace(file):
+    """Read the events of a trace written by `TraceRecorder`.
+
+    Args:
+        file (file): The file object with the trace, opened in binary mode
+
+    Yields:
+        tuple: The kind of the event (in `TRACE_EVENTS`), its tick, the no.
+            of the thread running then, and its argument
+
+    """
+    if file.read(len(_TRACE_MAGIC)) != _TRACE_MAGIC:
+        raise ValueError(f"{file.name} is not a trace")
+    while True:
+        chunk = file.read(_TRACE_EVENT.size * 4096)
+        # Skip any event cut short, eg. by the interpreter being killed
+        chunk = chunk[: len(chunk) - len(chunk) % _TRACE_EVENT.size]
+        if not chunk:
+            break
+        for kind, tick, thread, arg in _TRACE_EVENT.iter_unpack(chunk):
+            yield TRACE_EVENTS[kind], tick, thread, arg
+
+
+def _show(value, depth=None):
+    """Get a short rendering of a computed Oz value, for debugging.
+
+    Args:
+        value (tuple): The computed Oz value
+        depth (int): The nesting of records to show, or None to show all
+
+    Returns:
+        str: The rendering
+
+    """
+    if type(value) is Literal:
+        return repr(value.value)
+    elif type(value) is Variable:
+        return f"<{value.name}>"
+    elif type(value) is Record and depth == 0:
+        return f"{value.literal.value}(...)"
+    elif type(value) is Record:
+        inner = None if depth is None else depth - 1
+        fields = " ".join(
+            f"{_show(feat)}:{_show(val, inner)}"
+            for feat, val in value.fields.items()
+        )
+        return f"{value.literal.value}({fields})"
+    elif type(value) is Proc:
+        return f"proc/{len(value.args)}"
+    elif type(value) in {Port, Dictionary, Array}:
+        return f"{type(value).__name__.lower()} {value.name}"
+    else:  # vectors summarize themselves
+        return repr(value)
+
+
+class _Brief:
+    """A value or AST in a log message, only rendered if it's emitted.
+
+    Only the outer levels of nesting are shown, so that logging a statement
+    doesn't take time in the size of the values that it uses.
+    """
+
+    __slots__ = ("value",)
+
+    _ast_repr = reprlib.Repr()
+    _ast_repr.maxlevel = _LOG_DEPTH
+
+    def __init__(self, value):
+        """Keep the computed Oz value, or the AST."""
+        self.value = value
+
+    def __str__(self):
+        """Render the value or AST."""
+        if type(self.value) in _VALUE_TYPES:
+            return _show(self.value, _LOG_DEPTH)
+        return self._ast_repr.repr(self.value)
+
+
+class _StoreDelta:
+    """The changes made to the SAS by a statement, for debug logging.
+
+    These are only rendered when logged, so that debug output takes time in
+    the size of the changes instead of that of the whole SAS.
+    """
+
+    __slots__ = ("changes",)
+
+    def __init__(self, changes):
+        """Keep a list of changes.
+
+        Args:
+            changes (list): The changes, as ("new", var) for new variables,
+                ("merge", var1, var2) for merged classes, and ("bind", vars,
+                value) for bound classes
+
+        """
+        self.changes = changes
+
+    def __str__(self):
+        """Render the changes, eg. "new 4; 4 = 2; 2 := f(1:<5>)"."""
+        parts = []
+        for change in self.changes:
+            if change[0] == "new":
+                parts.append(f"new {change[1]}")
+            elif change[0] == "merge":
+                parts.append(f"{change[1]} = {change[2]}")
+            else:
+                value = _show(change[2], _LOG_DEPTH)
+                parts.append(f"{min(change[1])} := {value}")
+        return "; ".join(parts)
+
+
+def _arith(oper, lhs, rhs):
+    """Compute an arithmetic operation over two computed Oz values.
+
+    Operations over vectors are elementwise, with literals being used for
+    every element.
+    """
+    if Vector in {type(lhs), type(rhs)}:
+        return _vector_arith(oper, lhs, rhs)
+    elif type(lhs) is not Literal or type(rhs) is not Literal:
+        raise TypeError(f"{oper} can only be performed over literals")
+    elif oper == "sum":
+        return Literal(lhs.value + rhs.value)
+    else:
+        return Literal(lhs.value * rhs.value)
+
+
+def _vector_arith(oper, lhs, rhs):
+    """Compute an elementwise arithmetic operation involving vectors."""
+    operands = []
+    for val in lhs, rhs:
+        if type(val) is Vector:
+            operands.append(val.array)
+        elif type(val) is Literal:
+            operands.append(val.value)
+        else:
+            raise TypeError(f"{oper} can only be performed over literals")
+    if type(lhs) is type(rhs) and lhs.array.shape != rhs.array.shape:
+        raise TypeError(f"{oper} of vectors of different lengths")
+
+    if oper == "sum":
+        return _vector(np.add(*operands))
+    else:
+        return _vector(np.multiply(*operands))
+
+
+def _vector(items):
+    """Create a vector from a sequence of numeric Python values."""
+    if np is None:
+        raise NotImplementedError("Vectors need NumPy to be installed")
+    array = np.array(items)
+    if array.dtype.kind not in {"i", "u", "f"}:
+        raise TypeError("Vectors can only have integer or float elements")
+    array.setflags(write=False)  # values are immutable, so they're shared
+    return Vector(array)
+
+
+def _vector_fill(length, item):
+    """Create a vector of the given length, with every element equal."""
+    if type(length) is not Literal or type(length.value) is not int:
+        raise TypeError("Vectors can only have an integer length")
+    elif length.value < 0:
+        raise ValueError(f"{length.value} is an invalid length of a vector")
+    elif type(item) is not Literal:
+        raise TypeError("Vectors can only be created from literals")
+    return _vector([item.value] * length.value)
+
+
+def _reduce(oper, vector):
+    """Reduce a vector to a literal with a NumPy reduction."""
+    if type(vector) is not Vector:
+        raise TypeError(f"{oper} can only be reduced over vectors")
+    elif oper not in _REDUCTIONS:
+        raise ValueError(f"{oper} is an invalid reduction")
+    elif len(vector.array) == 0 and oper in {"min", "max"}:
+        raise ValueError(f"{oper} of an empty vector")
+    return Literal(getattr(np, _REDUCTIONS[oper])(vector.array).item())
+
+
+def _index(vector, index):
+    """Get an element of a vector by its index, which starts at 1."""
+    if type(vector) is not Vector:
+        raise TypeError("Only vectors can be indexed")
+    elif type(index) is not Literal or type(index.value) is not int:
+        raise TypeError("Vectors can only be indexed by integers")
+    elif not 1 <= index.value <= len(vector.array):
+        raise ValueError(f"{index.value} is out of the vector's bounds")
+    return Literal(vector.array[index.value - 1].item())
+
+
+def _entity_kinds(stmt):
+    """Get the kinds of the arguments of a dictionary or array statement.
+
+    Args:
+        stmt (list): The Oz statement's AST
+
+    Returns:
+        tuple: The kinds, as in `_ENTITY_OPS`, or None if the statement isn't
+            a valid operation
+
+    """
+    if len(stmt) < 2 or type(stmt[1]) is not str:
+        return None
+    kinds = _ENTITY_OPS.get((stmt[0], stmt[1]))
+    if kinds is None or len(stmt) != len(kinds) + 2:
+        return None
+    return kinds
+
+
+def _dictionary_op(entries, op, args):
+    """Run an operation on the entries of a dictionary.
+
+    Args:
+        entries (dict): The values of the dictionary, by the `_literal_key` of
+            their keys
+        op (str): The operation, other than "new"
+        args (list): The computed arguments after the dictionary, without
+            the result
+
+    Returns:
+        tuple: The result of the operation, if it has one
+
+    """
+    if op == "size":
+        return Literal(len(entries))
+    elif type(args[0]) is not Literal:
+        raise TypeError("Dictionaries can only have literal keys")
+
+    key = _literal_key(args[0])
+    if op == "put":
+        entries[key] = args[1]
+    elif op == "get":
+        if key not in entries:
+            raise KeyError(f"{args[0].value!r} isn't in the dictionary")
+        return entries[key]
+    elif op == "condGet":
+        return entries.get(key, args[1])
+    else:  # remove
+        entries.pop(key, None)
+
+
+def _array_op(low, cells, op, args):
+    """Run an operation on the cells of an array.
+
+    Args:
+        low (int): The index of the first cell
+        cells (list): The values of the cells
+        op (str): The operation, other than "new"
+        args (list): The computed arguments after the array, without the
+            result
+
+    Returns:
+        tuple: The result of the operation, if it has one
+
+    """
+    if op == "size":
+        return Literal(len(cells))
+    elif type(args[0]) is not Literal or type(args[0].value) is not int:
+        raise TypeError("Arrays can only be indexed by integers")
+
+    index = args[0].value - low
+    if not 0 <= index < len(cells):
+        if op == "condGet":
+            return args[1]
+        raise ValueError(f"{args[0].value} is out of the array's bounds")
+    elif op == "put":
+        cells[index] = args[1]
+    else:  # get or condGet
+        return cells[index]
+
+
+def _has_effects(ast):
+    """Check whether an AST has any statements in `_IMPURE`, at any depth."""
+    if type(ast) not in {list, tuple}:  # identifiers, literals & options
+        return False
+    elif ast and type(ast[0]) is str and ast[0] in _IMPURE:
+        return True
+    return any(_has_effects(item) for item in ast)
+
+
+def _is_tabled(value):
+    """Check whether a procedure's AST asks for its calls to be memoized.
+
+    Tabled procedures must be pure, as memoized calls don't run their bodies,
+    so procedures with statements in `_IMPURE` (even in nested procedures)
+    can't be tabled.
+    """
+    if len(value) <= 3:
+        return False
+    elif value[3] != "memo":
+        raise ValueError(f"{value[3]} is an invalid procedure option")
+    elif _has_effects(value[2]):
+        raise ValueError(
+            "Tabled procedures can't use ports, dictionaries or arrays"
+        )
+    return True
+
+
+def _value_operands(value, names, lists):
+    """Collect the operands that a value's AST waits for.
+
+    Args:
+        value: The Oz value's AST
+        names (list): The names of the identifiers which must be bound, which
+            are appended to
+        lists (list): The ASTs which must be lists with every item bound,
+            which are appended to
+
+    """
+    if type(value) in _VALUE_TYPES or type(value) is Ident:
+        return  # unifying these never waits
+    elif value[0] == "record":
+        for _, val in value[2]:
+            _value_operands(val, names, lists)
+    elif value[0] == "proc":
+        return  # the body waits when called
+    elif value[0] == "vector" and len(value) == 2:
+        _value_operands(value[1], names, lists)
+        lists.append(value[1])
+    else:  # Oz operations
+        for oper in value[2:] if value[0] == "reduce" else value[1:]:
+            if type(oper) is Ident:
+                names.append(oper.name)
+            else:
+                _value_operands(oper, names, lists)
+
+
+def _stmt_operands(stmt):
+    """Get the operands that a suspendable statement waits for.
+
+    Args:
+        stmt (list): The Oz statement's AST
+
+    Returns:
+        tuple: The names of the identifiers which must be bound
+        tuple: The ASTs which must be lists with every item bound
+
+    """
+    names, lists = [], []
+    if stmt[0] == "bind":
+        _value_operands(stmt[1], names, lists)
+        _value_operands(stmt[2], names, lists)
+    elif stmt[0] == "send":
+        names.append(stmt[1].name)
+        _value_operands(stmt[2], names, lists)
+    elif stmt[0] in {"dictionary", "array"}:
+        for kind, arg in zip(_entity_kinds(stmt) or (), stmt[2:]):
+            if kind in {"entity", "operand"} and type(arg) is Ident:
+                names.append(arg.name)
+            else:
+                _value_operands(arg, names, lists)
+    elif type(stmt[1]) is Ident:  # condition, case or procedure
+        names.append(stmt[1].name)
+    return tuple(names), tuple(lists)
+
+
+def _frame(stmt, env):
+    """Get the stack entry for running a statement with the given env.
+
+    Stack entries are (sequence, index, env) tuples, which run the statements
+    of the sequence starting from the index. A single statement is treated as
+    a sequence of one.
+    """
+    if type(stmt[0]) is list:
+        return (stmt, 0, env)
+    else:
+        return ((stmt,), 0, env)
+
+
+class _ProcCompiler:
+    """Compiler from the body of a hot procedure to a Python function.
+
+    The generated function keeps the SAS variables of Oz identifiers in Python
+    locals, binds unbound variables in place and accesses the SAS directly.
+    When it reaches a statement that it can't run right away, such as one that
+    would suspend or one that creates a thread, it stops and returns the rest
+    of the body as stack entries, so that the generic path takes over.
+    """
+
+    def __init__(self, interp):
+        """Initialize an empty function."""
+        self.interp = interp
+        self.consts = []  # objects referred to by the generated code
+        self.lines = []
+        self.num_locals = 0
+        self.seqs = {}  # constants for sequences, by their IDs
+
+    def _const(self, obj):
+        """Store a constant for the generated code and return its name."""
+        self.consts.append(obj)
+        return f"K[{len(self.consts) - 1}]"
+
+    def _local(self):
+        """Get the name of a new Python local."""
+        self.num_locals += 1
+        return f"v{self.num_locals}"
+
+    def _emit(self, depth, line):
+        """Add a line of code at the given indentation depth."""
+        self.lines.append("    " * depth + line)
+
+    def _seq_const(self, stmts):
+        """Get the name of the constant for a sequence of statements."""
+        if id(stmts) not in self.seqs:
+            self.seqs[id(stmts)] = self._const(stmts)
+        return self.seqs[id(stmts)]
+
+    def _frames(self, conts, top=None):
+        """Get the code for the stack entries of a continuation.
+
+        Args:
+            conts (list): The (sequence, index, scope) entries for the
+                remaining parts of enclosing sequences, outermost first
+            top (tuple): The (sequence, index, scope) entry to be put on top
+                of the stack, if any
+
+        Returns:
+            str: The Python expression for the list of stack entries
+
+        """
+        conts = [cont for cont in conts if cont[1] < len(cont[0])]
+        if top is not None:
+            conts.append(top)
+        frames = [
+            f"({self._seq_const(stmts)}, {index}, {self._env(scope)})"
+            for stmts, index, scope in conts
+        ]
+        return f"[{', '.join(frames)}]"
+
+    def _env(self, scope):
+        """Get the code for building the environment of a scope."""
+        items = [f"{name!r}: {local}" for name, local in scope.items()]
+        return f"{{{', '.join(items)}}}"
+
+    def _value(self, value, scope, checks):
+        """Get the code computing an Oz value.
+
+        Args:
+            value (tuple): The Oz value's AST
+            scope (dict): The mapping of identifiers to Python locals
+            checks (list): The list to which the locals that must be bound
+                before computing the value are added
+
+        Returns:
+            str: The Python expression for the computed value
+
+        """
+        if type(value) is Ident:
+            return f"Variable({scope[value.name]})"
+
+        elif type(value) is Literal:
+            return self._const(value)
+
+        elif value[0] == "record":
+            if self.interp.hash_cons:
+                # Ground records are built once, and hash-consed beforehand
+                try:
+                    record = self.interp._compute({}, value)
+                except KeyError:  # refers to identifiers
+                    pass
+                else:
+                    if type(record.fields) is _GroundFields:
+                        return self._const(record)
+
+            fields = ", ".join(
+                f"{self._const(feat)}: {self._value(val, scope, checks)}"
+                for feat, val in value[2]
+            )
+            return f"Record({self._const(value[1])}, {{{fields}}})"
+
+        elif value[0] == "proc":
+            fvars = self.interp.get_fvars_value(value)
+            ctx_env = self._env({fvar: scope[fvar] for fvar in fvars})
+            args = self._const(value[1])
+            contents = self._const(value[2])
+            return f"Proc({args}, {contents}, {ctx_env}, {_is_tabled(value)})"
+
+        elif value[0] in {"sum", "product"}:
+            operands = [
+                self._operand(oper, scope, checks) for oper in value[1:]
+            ]
+            return f"_arith({value[0]!r}, {', '.join(operands)})"
+
+        elif value[0] == "vector" and len(value) == 3:
+            operands = [
+                self._operand(oper, scope, checks) for oper in value[1:]
+            ]
+            return f"_vector_fill({', '.join(operands)})"
+
+        elif value[0] == "reduce":
+            operand = self._operand(value[2], scope, checks)
+            return f"_reduce({value[1]!r}, {operand})"
+
+        elif value[0] == "index":
+            operands = [
+                self._operand(oper, scope, checks) for oper in value[1:]
+            ]
+            return f"_index({', '.join(operands)})"
+
+        else:  # incl. vectors of lists, which wait for every list item
+            raise NotImplementedError(f"{value}")
+
+    def _operand(self, oper, scope, checks):
+        """Generate the expression for an operand that must be bound."""
+        if type(oper) is Ident:
+            checks.append(scope[oper.name])
+            return f"sas[{scope[oper.name]}].value"
+        else:
+            return self._value(oper, scope, checks)
+
+    def _seq(self, stmt, scope, conts, depth):
+        """Generate the code for a statement or a sequence of statements."""
+        stmts = stmt if type(stmt[0]) is list else (stmt,)
+        start = len(self.lines)
+
+        for i, sub_stmt in enumerate(stmts):
+            sub_conts = conts + [(stmts, i + 1, scope)]
+            if type(sub_stmt[0]) is list:
+                self._seq(sub_stmt, scope, sub_conts, depth)
+            else:
+                self._stmt(sub_stmt, scope, sub_conts, depth)
+
+        if len(self.lines) == start:
+            self._emit(depth, "pass")
+
+    def _stmt(self, stmt, scope, conts, depth):
+        """Generate the code for a single statement."""
+        stmts, index, _ = conts[-1]
+        top = (stmts, index - 1, scope)
+        suspend = f"return {self._frames(conts[:-1], top)}"
+
+        if stmt[0] == "nop":
+            return
+
+        elif stmt[0] == "var":
+            new = self._local()
+            self._emit(depth, f"{new} = len(sas)")
+            self._emit(depth, f"sas.append(_EqClass({new}))")
+            self._seq(stmt[2], {**scope, stmt[1].name: new}, conts, depth)
+
+        elif stmt[0] == "bind":
+            checks = []
+            lhs = self._value(stmt[1], scope, checks)
+            rhs = self._value(stmt[2], scope, checks)
+            for local in dict.fromkeys(checks):
+                self._emit(depth, f"if sas[{local}].value is None:")
+                self._emit(depth + 1, suspend)
+
+            if type(stmt[1]) is Ident and type(stmt[2]) is Ident:
+                lhs, rhs = scope[stmt[1].name], scope[stmt[2].name]
+                self._emit(depth, f"if sas[{lhs}] is not sas[{rhs}]:")
+                self._emit(
+                    depth + 1, f"unify({{}}, Variable({lhs}), Variable({rhs}))"
+                )
+            elif type(stmt[1]) is Ident or type(stmt[2]) is Ident:
+                if type(stmt[1]) is Ident:
+                    var, value = scope[stmt[1].name], rhs
+                else:
+                    var, value = scope[stmt[2].name], lhs
+                eq_class = self._local()
+                self._emit(depth, f"{eq_class} = sas[{var}]")
+                self._emit(depth, f"if {eq_class}.value is None:")
+                self._emit(depth + 1, f"bind({eq_class}, {value})")
+                self._emit(depth, "else:")
+                self._emit(depth + 1, f"unify({{}}, Variable({var}), {value})")
+            else:
+                self._emit(depth, f"unify({{}}, {lhs}, {rhs})")
+
+        elif stmt[0] == "conditional":
+            cond = self._local()
+            if type(stmt[1]) is Literal:
+                ident = repr(stmt[1])
+                self._emit(depth, f"{cond} = {self._const(stmt[1])}")
+            else:
+                ident = stmt[1].name
+                self._emit(depth, f"{cond} = sas[{scope[ident]}].value")
+                self._emit(depth, f"if {cond} is None:")
+                self._emit(depth + 1, suspend)
+            self._emit(
+                depth,
+                f"if type({cond}) is not Literal"
+                f" or type({cond}.value) is not bool:",
+            )
+            self._emit(
+                depth + 1, f"raise TypeError({ident + ' is not a boolean'!r})"
+            )
+            self._emit(depth, f"if {cond}.value:")
+            self._seq(stmt[2], scope, conts, depth + 1)
+            self._emit(depth, "else:")
+            self._seq(stmt[3], scope, conts, depth + 1)
+
+        elif stmt[0] == "match":
+            if stmt[2][0] != "record":
+                raise TypeError(f"Invalid pattern: {stmt[2]}")
+            pattern = {feat: val for feat, val in stmt[2][2]}
+
+            value = self._local()
+            self._emit(depth, f"{value} = sas[{scope[stmt[1].name]}].value")
+            self._emit(depth, f"if {value} is None:")
+            self._emit(depth + 1, suspend)
+            self._emit(
+                depth,
+                f"if type({value}) is Record"
+                f" and {value}.literal == {self._const(stmt[2][1])}"
+                f" and {value}.fields.keys() == {self._const(set(pattern))}:",
+            )
+
+            new_scope = dict(scope)
+            for feat, item in pattern.items():
+                if type(item) is not Ident:
+                    continue
+                new, field = self._local(), self._local()
+                self._emit(depth + 1, f"{new} = len(sas)")
+                self._emit(
+                    depth + 1, f"{field} = {value}.fields[{self._const(feat)}]"
+                )
+                # Same as unifying a new variable with the field
+                self._emit(depth + 1, f"if type({field}) is Variable:")
+                self._emit(depth + 2, f"{field} = sas[{field}.name]")
+                self._emit(depth + 2, f"{field}.vars.add({new})")
+                self._emit(depth + 2, f"sas.append({field})")
+                self._emit(depth + 1, "else:")
+                self._emit(depth + 2, f"sas.append(_EqClass({new}))")
+                self._emit(depth + 2, f"sas[{new}].value = {field}")
+                new_scope[item.name] = new
+
+            self._seq(stmt[3], new_scope, conts, depth + 1)
+            self._emit(depth, "else:")
+            self._seq(stmt[4], scope, conts, depth + 1)
+
+        elif stmt[0] == "newport":
+            stream, port = scope[stmt[1].name], scope[stmt[2].name]
+            self._emit(
+                depth, f"unify({{}}, Variable({port}), new_port({stream}))"
+            )
+
+        elif stmt[0] == "send":
+            checks = []
+            value = self._value(stmt[2], scope, checks)
+            port = self._local()
+            self._emit(depth, f"{port} = sas[{scope[stmt[1].name]}].value")
+            self._emit(depth, f"if {port} is None:")
+            self._emit(depth + 1, suspend)
+            for local in dict.fromkeys(checks):
+                self._emit(depth, f"if sas[{local}].value is None:")
+                self._emit(depth + 1, suspend)
+            self._emit(depth, f"if type({port}) is not Port:")
+            self._emit(
+                depth + 1,
+                f"raise TypeError({stmt[1].name + ' is not a port'!r})",
+            )
+            self._emit(depth, f"port_send({port}, {value})")
+
+        elif stmt[0] == "apply":
+            proc, frames = self._local(), self._local()
+            entry = self._local()
+            args = "".join(f"{scope[param.name]}, " for param in stmt[2:])
+            self._emit(depth, f"{proc} = sas[{scope[stmt[1].name]}].value")
+            self._emit(depth, f"if {proc} is None:")
+            self._emit(depth + 1, suspend)
+
+            # Compiled procedures are called directly, without looking them
+            # up (and counting calls) through `_invoke` or building an env
+            self._emit(depth, f"{frames} = None")
+            self._emit(
+                depth,
+                f"if type({proc}) is Proc and len({proc}.args) =="
+                f" {len(stmt) - 2} and not {proc}.tabled and depth <"
+                f" {_MAX_JIT_DEPTH - 1}:",
+            )
+            self._emit(
+                depth + 1,
+                f"{entry} = compiled_procs.get((id({proc}.args),"
+                f" id({proc}.contents)))",
+            )
+            self._emit(depth + 1, f"if {entry} is not None and {entry}[1]:")
+            self._emit(
+                depth + 2,
+                f"{frames} = {entry}[1](interp, {proc}.ctxenv, ({args}),"
+                " depth + 1)",
+            )
+            self._emit(depth, f"if {frames} is None:")
+            self._emit(
+                depth + 1,
+                f"{frames} = invoke({proc}, {stmt[1].name!r}, ({args}),"
+                " depth + 1)",
+            )
+            self._emit(depth, f"if {frames}:")
+            self._emit(depth + 1, f"return {self._frames(conts)} + {frames}")
+
+        elif stmt[0] in {"dictionary", "array"} and _entity_kinds(stmt):
+            checks, args = [], []
+            kinds = _entity_kinds(stmt)
+            for kind, arg in zip(kinds, stmt[2:]):
+                if kind in {"value", "result"}:
+                    args.append(self._value(arg, scope, checks))
+                else:
+                    args.append(self._operand(arg, scope, checks))
+            for local in dict.fromkeys(checks):
+                self._emit(depth, f"if sas[{local}].value is None:")
+                self._emit(depth + 1, suspend)
+
+            result = args.pop() if kinds[-1] == "result" else None
+            call = f"entity_op({stmt[0]!r}, {stmt[1]!r}, [{', '.join(args)}])"
+            if result is None:
+                self._emit(depth, call)
+            else:
+                self._emit(depth, f"unify({{}}, {result}, {call})")
+
+        else:  # eg. threads, which only the generic path can create
+            self._emit(depth, suspend)
+
+    def compile(self, proc, name):
+        """Compile the given procedure's body.
+
+        Args:
+            proc (tuple): The procedure value
+            name (str): The name of the procedure, for debugging purposes
+
+        Returns:
+            function: The function running the body, which takes the
+                interpreter, the contextual environment, the tuple of SAS
+                variables passed as arguments and the nesting depth of
+                compiled calls, and returns the list of stack entries that
+                are left to be run
+
+        """
+        # Keep the body alive, as compiled functions are cached by its ID
+        self._const(proc.contents)
+
+        scope = {}
+        for fvar in proc.ctxenv:
+            scope[fvar] = self._local()
+            self._emit(1, f"{scope[fvar]} = ctxenv[{fvar!r}]")
+        for i, arg in enumerate(proc.args):
+            scope[arg.name] = self._local()
+            self._emit(1, f"{scope[arg.name]} = argvars[{i}]")
+
+        self._seq(proc.contents, scope, [], 1)
+        self._emit(1, "return ()")
+
+        # Only the methods of the interpreter that the body uses are looked
+        # up, as this is done on every call
+        body = "\n".join(self.lines)
+        lines = ["def compiled(interp, ctxenv, argvars, depth):"]
+        lines.append("    sas = interp.sas")
+        for local, attr in _COMPILED_ATTRS:
+            if re.search(rf"\b{local}\b", body):
+                lines.append(f"    {local} = interp.{attr}")
+        code = "\n".join(lines + [body])
+        logging.debug("compiled code for %s:\n%s", name, code)
+        namespace = {
+            "K": self.consts,
+            "Literal": Literal,
+            "Variable": Variable,
+            "Record": Record,
+            "Proc": Proc,
+            "Port": Port,
+            "_EqClass": _EqClass,
+            "_arith": _arith,
+            "_vector_fill": _vector_fill,
+            "_reduce": _reduce,
+            "_index": _index,
+        }
+        exec(compile(code, f"<compiled {name}>", "exec"), namespace)
+        return namespace["compiled"]
+
+
+class _Optimizer:
+    """Static optimizer for Oz ASTs.
+
+    This folds constant arithmetic, eliminates branches whose conditions are
+    known statically, drops no-ops and flattens nested sequences. Identifiers
+    are known to be bound to literals after a preceding binding in the same
+    thread, as the SAS only ever grows. This is only done for identifiers that
+    the thread declared and hasn't used before, as binding a bound variable to
+    a literal only checks that they're equal (eg. for `1` and `true`).
+    """
+
+    def __init__(self):
+        """Initialize the report of the reductions made."""
+        self.report = Counter()
+
+    def optimize(self, ast):
+        """Optimize the given Oz AST, without modifying it in place."""
+        return self._block(ast, {})
+
+    def _operand(self, oper, known):
+        """Optimize an operand of an arithmetic operation."""
+        if type(oper) is Ident:
+            literal = known.get(oper.name)
+            return oper if literal is None else literal
+        else:
+            return self._value(oper, known)
+
+    def _value(self, value, known):
+        """Optimize an Oz value.
+
+        Args:
+            value (tuple): The Oz value's AST
+            known (dict): The mapping of identifiers to the literals that they
+                are known to be bound to, or None if they're still unused
+
+        Returns:
+            tuple: The optimized AST
+
+        """
+        if type(value) in {Ident, Literal}:
+            return value
+
+        elif value[0] == "record":
+            fields = [
+                (feat, self._value(val, known)) for feat, val in value[2]
+            ]
+            return [value[0], value[1], fields]
+
+        elif value[0] == "proc":
+            args = {arg.name for arg in value[1]}
+            body_known = {
+                ident: lit
+                for ident, lit in known.items()
+                if ident not in args and lit is not None
+            }
+            body = self._block(value[2], body_known)
+            return [value[0], value[1], body, *value[3:]]
+
+        elif value[0] in {"sum", "product"}:
+            operands = [self._operand(oper, known) for oper in value[1:]]
+            try:
+                folded = _arith(value[0], *operands)
+            except TypeError:  # not literals, so leave it to the runtime
+                return [value[0], *operands]
+            else:
+                self.report["folded"] += 1
+                return folded
+
+        else:  # Misc. Oz operations
+            return value
+
+    def _block(self, stmt, known):
+        """Optimize a statement into a single one."""
+        stmts = self._seq(stmt, known)
+        if len(stmts) == 0:
+            return ["nop"]
+        elif len(stmts) == 1:
+            return stmts[0]
+        else:
+            return stmts
+
+    def _seq(self, stmt, known):
+        """Optimize a statement into a flat list of statements.
+
+        Args:
+            stmt (tuple): The Oz statement's AST
+            known (dict): The mapping of identifiers to the literals that they
+                are known to be bound to, or None if they're still unused,
+                which is updated with what is known after the statement
+
+        Returns:
+            list: The optimized statements, to be run in sequence
+
+        """
+        if stmt[0] == "nop":
+            self.report["nops"] += 1
+            return []
+
+        elif type(stmt[0]) is list:
+            stmts = []
+            spawn = None  # the last thread statement, and what it became
+            for sub_stmt in stmt:
+                if spawn is not None and sub_stmt is spawn[0]:
+                    # Threads don't change what's known, so repeats of a
+                    # thread statement can share the optimized one, and thus
+                    # the initial frames of the threads spawned
+                    stmts.extend(spawn[1])
+                    continue
+                if type(sub_stmt[0]) is list:
+                    self.report["flattened"] += 1
+                optimized = self._seq(sub_stmt, known)
+                if sub_stmt[0] == "thread":
+                    spawn = (sub_stmt, optimized)
+                else:
+                    spawn = None
+                stmts.extend(optimized)
+            return stmts
+
+        elif stmt[0] == "var":
+            ident = stmt[1].name
+            body_known = dict(known)
+            body_known[ident] = None
+            body = self._block(stmt[2], body_known)
+
+            # The new variable shadows the outer one only inside the body
+            body_known.pop(ident, None)
+            for name in [
+                name
+                for name, lit in known.items()
+                if lit is None and name not in body_known
+            ]:
+                del known[name]  # used in the body
+            known.update(body_known)
+            return [[stmt[0], stmt[1], body]]
+
+        elif stmt[0] == "bind":
+            lhs = self._value(stmt[1], known)
+            rhs = self._value(stmt[2], known)
+            bound = []
+            for var, value in [(lhs, rhs), (rhs, lhs)]:
+                value = self._operand(value, known)
+                if (
+                    type(var) is Ident
+                    and type(value) is Literal
+                    and var.name in known
+                    and known[var.name] is None
+                ):
+                    bound.append((var.name, value))
+            self._forget(stmt, known)
+            known.update(bound)
+            return [[stmt[0], lhs, rhs]]
+
+        elif stmt[0] == "conditional":
+            cond = self._operand(stmt[1], known)
+            if type(cond) is Literal and type(cond.value) is bool:
+                self.report["branches"] += 1
+                return self._seq(stmt[2] if cond.value else stmt[3], known)
+            else:
+                then = self._block(stmt[2], dict(known))
+                otherwise = self._block(stmt[3], dict(known))
+                self._forget(stmt, known)
+                return [[stmt[0], stmt[1], then, otherwise]]
+
+        elif stmt[0] == "match":
+            if type(self._operand(stmt[1], known)) is Literal:
+                # Literals never match record patterns
+                self.report["branches"] += 1
+                return self._seq(stmt[4], known)
+
+            then_known = dict(known)
+            for ident in self._pattern_idents(stmt[2]):
+                then_known.pop(ident, None)
+            then = self._block(stmt[3], then_known)
+            otherwise = self._block(stmt[4], dict(known))
+            self._forget(stmt, known)
+            return [[stmt[0], stmt[1], stmt[2], then, otherwise]]
+
+        elif stmt[0] == "send":
+            value = self._value(stmt[2], known)
+            self._forget(stmt, known)
+            return [[stmt[0], stmt[1], value]]
+
+        elif stmt[0] == "thread":
+            # Whatever the thread binds is only known inside it, and it runs
+            # alongside this thread, which can bind what it uses at any time
+            body_known = {
+                ident: lit for ident, lit in known.items() if lit is not None
+            }
+            body = self._block(stmt[1], body_known)
+            self._forget(stmt, known)
+            return [[stmt[0], body, *stmt[2:]]]
+
+        else:  # eg. procedure calls, about which nothing is known
+            self._forget(stmt, known)
+            return [stmt]
+
+    @staticmethod
+    def _forget(stmt, known):
+        """Remove the unused identifiers that a statement uses from `known`."""
+        unused = [ident for ident, lit in known.items() if lit is None]
+        if unused:
+            used = _Optimizer._idents(stmt)
+            for ident in unused:
+                if ident in used:
+                    del known[ident]
+
+    @staticmethod
+    def _idents(ast):
+        """Get the names of all identifiers in an AST."""
+        if type(ast) is Ident:
+            return {ast.name}
+        elif type(ast) in {list, tuple}:  # not literals
+            idents = set()
+            for item in ast:
+                idents |= _Optimizer._idents(item)
+            return idents
+        else:
+            return set()
+
+    @staticmethod
+    def _pattern_idents(pattern):
+        """Get the identifiers introduced by a case statement's pattern."""
+        if type(pattern) is Ident:
+            return {pattern.name}
+        elif type(pattern) is Literal or pattern[0] != "record":
+            return set()
+        else:
+            return {val.name for _, val in pattern[2] if type(val) is Ident}
 
 
 class Interpreter:
     """The Oz interpreter."""
 
-    def __init__(self):
-        """Initialize the single-assignment store."""
+    def __init__(
+        self,
+        jit_threshold=_JIT_THRESHOLD,
+        optimize=True,
+        mem_interval=None,
+        priority_shares=None,
+        hash_cons=False,
+        trace=None,
+        replay=None,
+        memo_size=_MEMO_SIZE,
+    ):
+        """Initialize the single-assignment store.
+
+        Args:
+            jit_threshold (int): The number of calls after which a procedure's
+                body is compiled into a Python function, or None to always
+                interpret procedure bodies
+            optimize (bool): Whether to statically optimize the AST before
+                running it
+            mem_interval (int): The no. of ticks between samples of memory
+                usage, which are kept in `mem_report`, or None to not sample
+                memory usage
+            priority_shares (dict): The relative share of steps for each
+                thread priority, with the defaults in `PRIORITY_SHARES`
+            hash_cons (bool): Whether structurally equal ground records
+                should share their fields, so that they are unified by an
+                identity check
+            trace (str): The path of the file to record a binary trace of
+                each run into (see `TraceRecorder`), or None to not trace
+            replay (str): The path of the trace of an earlier run of the same
+                AST with the same options, whose interleaving of threads is
+                to be repeated, or None to schedule threads normally
+            memo_size (int): The maximum no. of calls of tabled procedures
+                whose results are kept, with the least recently used ones
+                evicted first, or 0 to not memoize calls
+
+        """
         self.sas = []
+        self.jit_threshold = jit_threshold
+        self.optimize = optimize
+        self.opt_report = Counter()  # reductions made by the optimizer
+        self.mem_interval = mem_interval
+        self.mem_report = None
+        self.priority_shares = priority_shares
+        self.sched_stats = {}  # per-priority scheduler statistics
+        self.hash_cons = hash_cons
+        self.trace = trace
+        self.replay = replay
+        self._trace = None  # the recorder for the current run, if tracing
+        self.memo_size = memo_size
+        self.memo_stats = Counter()  # hits, misses & evictions of the memo
+        self._memo = OrderedDict()  # results of calls of tabled procedures
+        self._memo_calls = 0  # calls of tabled procedures still running
+        # Running calls of tabled procedures that waited for their arguments,
+        # by the IDs of the entries storing their results
+        self._memo_waits = {}
+        self._ground = WeakValueDictionary()  # hash-consed fields, by key
+        self._woken = []  # parked threads whose variables have been bound
+        self._ports = {}  # the tail variable of each port's stream, by name
+        self._dictionaries = {}  # the entries of each dictionary, by name
+        self._arrays = {}  # the first index & cells of each array, by name
+        self._inputs = {}  # the unread tail of each input, by its variable
+        self._sources = []  # the files of inputs, to be closed after a run
+        self._free = []  # variables collected from the SAS, for reuse
+        self._collect_at = None  # the SAS size for the next collection
+        self._stmt_fvars = {}  # free identifiers of stmts, for collections
+        self._stmt_opers = {}  # operands waited for by stmts, by their IDs
+        self._effects = {}  # whether procedure bodies are impure, by their IDs
+        self._pure_closures = {}  # checked procedure values, by their IDs
+        # The variable, procedure & argument identifiers last called at each
+        # call site, keyed by its ID
+        self._call_sites = {}
+        self._call_counts = {}  # for procedures that aren't compiled yet
+        self._compiled = {}  # compiled functions (or None, if uncompilable)
+        self._debug = False  # whether changes to the SAS are logged
+        self._changes = []  # changes to the SAS by the current statement
+        self._scheduler = None  # of the last run, for describing threads
 
     def _compute(self, env, value):
         """Compute the actual value of the given Oz "value"."""
-        if type(value) in {Literal, Variable, Record, Proc}:  # already done
-            return value
+        if type(value) in _VALUE_TYPES:
+            return value  # already computed
 
         elif type(value) is Ident:
             # Storing record values in the SAS which have variables inside them
@@ -76,47 +1770,199 @@ class Interpreter:
             return Variable(env[value.name])
 
         elif value[0] == "record":
-            return Record(
+            record = Record(
                 value[1],
                 {feat: self._compute(env, val) for feat, val in value[2]},
             )
+            if self.hash_cons:
+                record = self._intern(record)
+            return record
 
         elif value[0] == "proc":
             fvars = self.get_fvars_value(value)
             ctx_env = {fvar: env[fvar] for fvar in fvars}
-            return Proc(value[1], value[2], ctx_env)
+            return Proc(value[1], value[2], ctx_env, _is_tabled(value))
 
         elif value[0] in {"sum", "product"}:
-            operands = []
-            for oper in value[1:]:
-                if type(oper) is Ident:
-                    eq_class = self.sas[env[oper.name]]
-                    if eq_class.is_bound():
-                        oper_val = eq_class.value
-                    else:
-                        raise UnboundVariableError(
-                            f"{oper.name} is unbound", env[oper.name]
-                        )
-                else:
-                    oper_val = self._compute(env, oper)
+            operands = [self._operand(env, oper) for oper in value[1:]]
+            return _arith(value[0], *operands)
 
-                if type(oper_val) is not Literal:
-                    raise TypeError(
-                        f"{value[0]} can only be performed over literals"
-                    )
-                else:
-                    operands.append(oper_val)
+        elif value[0] == "vector" and len(value) == 3:
+            operands = [self._operand(env, oper) for oper in value[1:]]
+            return _vector_fill(*operands)
 
-            if value[0] == "sum":
-                return Literal(operands[0].value + operands[1].value)
-            elif value[0] == "product":
-                return Literal(operands[0].value * operands[1].value)
-            else:
-                raise RuntimeError(f"Invalid operator in: {value}")
+        elif value[0] == "vector":
+            items = self._list_items(self._operand(env, value[1]))
+            if any(type(item) is not Literal for item in items):
+                raise TypeError("Vectors can only be created from literals")
+            return _vector([item.value for item in items])
+
+        elif value[0] == "reduce":
+            return _reduce(value[1], self._operand(env, value[2]))
+
+        elif value[0] == "index":
+            operands = [self._operand(env, oper) for oper in value[1:]]
+            return _index(*operands)
 
         else:  # Misc. Oz operations
             raise NotImplementedError(f"{value}")
 
+    def _operand(self, env, oper):
+        """Compute an operand of an Oz operation, which must be bound."""
+        if type(oper) is not Ident:
+            return self._compute(env, oper)
+        eq_class = self.sas[env[oper.name]]
+        if not eq_class.is_bound():
+            raise UnboundVariableError(
+                f"{oper.name} is unbound", env[oper.name]
+            )
+        return eq_class.value
+
+    def _deref(self, value):
+        """Get the value of a SAS variable, which must be bound."""
+        if type(value) is not Variable:
+            return value
+        eq_class = self.sas[value.name]
+        if eq_class.is_bound():
+            return eq_class.value
+        elif self._inputs and self._read_input(eq_class):
+            return eq_class.value  # the unread tail of an input
+        raise UnboundVariableError(f"{value.name} is unbound", value.name)
+
+    def _list_items(self, value):
+        """Get the items of a list, all of which must be bound.
+
+        Args:
+            value (tuple): The computed Oz value of the list
+
+        Returns:
+            list: The computed values of the items
+
+        """
+        items = []
+        seen = set()  # IDs of the cells visited, for detecting cyclic lists
+        value = self._deref(value)
+        while type(value) is not Literal or value.value is not None:  # nil
+            if (
+                type(value) is not Record
+                or value.literal != _CONS
+                or value.fields.keys() != {_HEAD, _TAIL}
+            ):
+                raise TypeError("Vectors can only be created from lists")
+            elif id(value) in seen:
+                raise TypeError("Cyclic lists can't be made into vectors")
+            seen.add(id(value))
+            items.append(self._deref(value.fields[_HEAD]))
+            value = self._deref(value.fields[_TAIL])
+        return items
+
+    def _unbound(self, value):
+        """Get the variable of a value, if it's unbound.
+
+        The unread tail of an input isn't unbound, as it's read on demand.
+        """
+        if type(value) is not Variable:
+            return None
+        eq_class = self.sas[value.name]
+        if eq_class.is_bound() or (
+            self._inputs and self._read_input(eq_class)
+        ):
+            return None
+        return value.name
+
+    def _blocker(self, stmt, env):
+        """Get the variable that a statement waits for, before running it.
+
+        Statements only run once every operand that they wait for is bound,
+        so that running them never stops midway.
+
+        Args:
+            stmt (list): The Oz statement's AST
+            env (dict): The current variable environment
+
+        Returns:
+            int: An unbound SAS variable, or None if the statement can run
+
+        """
+        if type(stmt[0]) is not str or stmt[0] not in _SUSPENDABLE:
+            return None
+        opers = self._stmt_opers.get(id(stmt))
+        if opers is None:
+            # Kept with the stmt, so that its ID isn't reused
+            opers = self._stmt_opers[id(stmt)] = (stmt, *_stmt_operands(stmt))
+
+        for name in opers[1]:
+            eq_class = self.sas[env[name]]
+            if not eq_class.is_bound() and not (
+                self._inputs and self._read_input(eq_class)
+            ):
+                return env[name]
+        for value in opers[2]:
+            var = self._list_blocker(self._compute(env, value))
+            if var is not None:
+                return var
+        return None
+
+    def _list_blocker(self, value):
+        """Get an unbound variable of a list or of its items, if any.
+
+        Args:
+            value (tuple): The computed Oz value of the list
+
+        Returns:
+            int: The SAS variable, or None if the list is bound (or isn't a
+                list, which is an error when it's used)
+
+        """
+        seen = set()  # IDs of the cells visited, for detecting cyclic lists
+        while True:
+            var = self._unbound(value)
+            if var is not None:
+                return var
+            elif type(value) is Variable:
+                value = self.sas[value.name].value
+            if type(value) is not Record or id(value) in seen:
+                return None
+            seen.add(id(value))
+            var = self._unbound(value.fields.get(_HEAD))
+            if var is not None:
+                return var
+            value = value.fields.get(_TAIL)
+
+    def _intern(self, record):
+        """Get the hash-consed form of a record, if it's ground.
+
+        Args:
+            record (tuple): The record value, whose values have already been
+                hash-consed
+
+        Returns:
+            tuple: The record value sharing its fields with all equal ground
+                records, or the given one if it isn't ground
+
+        """
+        parts = []
+        for feat, val in record.fields.items():
+            if type(val) is Literal:
+                part = _literal_key(val)
+            elif type(val) is Record and type(val.fields) is _GroundFields:
+                # The shared fields of a value are alive as long as these
+                # fields, so their IDs are unique for this key's lifetime.
+                part = id(val.fields)
+            else:
+                return record
+            parts.append((_literal_key(feat), part))
+
+        try:
+            key = (_literal_key(record.literal), frozenset(parts))
+            fields = self._ground.get(key)
+        except TypeError:  # unhashable literal values
+            return record
+
+        if fields is None:
+            fields = self._ground[key] = _GroundFields(record.fields)
+        return Record(record.literal, fields)
+
     def get_fvars_value(self, value):
         """Get the free variables of an Oz variable or value/operation.
 
@@ -132,29 +1978,33 @@ class Interpreter:
         """
         if type(value) is Ident:
             fvars = {value.name}
-            logging.debug(f"free vars of {value.name}: {fvars}")
+            logging.debug("free vars of %s: %s", value.name, fvars)
 
         elif type(value) is Literal:
             fvars = set()
-            logging.debug(f"free vars of {value.value}: {fvars}")
+            logging.debug("free vars of %s: %s", value.value, fvars)
 
         elif value[0] == "record":
             fvars = set()
             for _, sub_val in value[2]:
                 fvars = fvars.union(self.get_fvars_value(sub_val))
-            logging.debug(f"free vars of {value[0]}: {fvars}")
+            logging.debug("free vars of %s: %s", value[0], fvars)
 
         elif value[0] == "proc":
             args = {arg.name for arg in value[1]}
             fvars = self.get_fvars(value[2])
             fvars.difference_update(args)
-            logging.debug(f"free vars of {value[0]}: {fvars}")
+            logging.debug("free vars of %s: %s", value[0], fvars)
 
-        elif value[0] in {"sum", "product"}:
-            lhs = self.get_fvars_value(value[1])
-            rhs = self.get_fvars_value(value[2])
-            fvars = lhs.union(rhs)
-            logging.debug(f"free vars of {value[0]}: {fvars}")
+        elif value[0] in {"sum", "product", "index", "vector"}:
+            fvars = set()
+            for oper in value[1:]:
+                fvars.update(self.get_fvars_value(oper))
+            logging.debug("free vars of %s: %s", value[0], fvars)
+
+        elif value[0] == "reduce":
+            fvars = self.get_fvars_value(value[2])
+            logging.debug("free vars of %s: %s", value[0], fvars)
 
         else:  # Misc. Oz operation
             raise NotImplementedError(f"{value}")
@@ -181,7 +2031,7 @@ class Interpreter:
 
         elif stmt[0] == "var":
             fvars = self.get_fvars(stmt[2])
-            fvars.remove(stmt[1].name)
+            fvars.discard(stmt[1].name)
 
         elif stmt[0] == "bind":
             fvars = set()
@@ -189,7 +2039,7 @@ class Interpreter:
                 fvars = fvars.union(self.get_fvars_value(oper))
 
         elif stmt[0] == "conditional":
-            fvars = {stmt[1].name}
+            fvars = self.get_fvars_value(stmt[1])
             fvars = fvars.union(self.get_fvars(stmt[2]))
             fvars = fvars.union(self.get_fvars(stmt[3]))
 
@@ -197,19 +2047,38 @@ class Interpreter:
             fvars = {stmt[1].name}
             fvars = fvars.union(self.get_fvars(stmt[4]))
             fvars = fvars.union(
-                self.get_fvars(stmt[3]).difference(self.get_fvars(stmt[2]))
+                self.get_fvars(stmt[3]).difference(
+                    self.get_fvars_value(stmt[2])
+                )
             )
 
         elif stmt[0] == "apply":
             fvars = {ident.name for ident in stmt[1:]}
 
+        elif stmt[0] == "newport":
+            fvars = {stmt[1].name, stmt[2].name}
+
+        elif stmt[0] == "input":
+            fvars = {stmt[1].name}
+
+        elif stmt[0] == "send":
+            fvars = {stmt[1].name}.union(self.get_fvars_value(stmt[2]))
+
+        elif stmt[0] in {"dictionary", "array"}:
+            fvars = set()
+            for arg in stmt[2:]:
+                fvars.update(self.get_fvars_value(arg))
+
+        elif stmt[0] == "thread":
+            fvars = self.get_fvars(stmt[1])
+
         else:
             raise ValueError(f"{stmt} is an invalid statement")
 
         if type(stmt[0]) is list:
-            logging.debug(f"free vars of combined statement: {fvars}")
+            logging.debug("free vars of combined statement: %s", fvars)
         else:
-            logging.debug(f"free vars of {stmt[0]}: {fvars}")
+            logging.debug("free vars of %s: %s", stmt[0], fvars)
         return fvars
 
     def _match_records(self, lhs, rhs):
@@ -248,11 +2117,11 @@ class Interpreter:
 
         # overwriting the input arguments, as they are no longer required
         lhs, rhs = sas_vars
-        logging.debug(f"unifying: {lhs} & {rhs}")
+        logging.debug("unifying: %s & %s", lhs, rhs)
 
         if rhs == marked.get(lhs, "") or lhs == marked.get(rhs, ""):
             logging.debug(
-                f"ignoring unification as {lhs} & {rhs} are marked unified"
+                "ignoring unification as %s & %s are marked unified", lhs, rhs
             )
             return
 
@@ -260,11 +2129,19 @@ class Interpreter:
         class2 = self.sas[rhs]
 
         if class1 is not class2:
+            if class1.is_bound() and not class2.is_bound():
+                # Merge into the unbound class, so that binding it wakes up
+                # the threads waiting on it.
+                class1, class2 = class2, class1
+
             if not class1.is_bound():
                 # If the class2 class is bound, then this take its value, else
-                # it stays unbound (as the class2 class's value is None).
-                class1.value = class2.value
-            elif class2.is_bound():
+                # it stays unbound, with the threads waiting on both.
+                if class2.is_bound():
+                    self._bind(class1, class2.value)
+                else:
+                    self._merge(class1, class2)
+            else:
                 # Both variables are bound, so in order to prevent infinite
                 # recursion in unification of record values, we need to unify
                 # their values after marking the variables as unified.
@@ -274,6 +2151,8 @@ class Interpreter:
                     env, class1.value, class2.value, marked=marked
                 )
             class1.vars = class1.vars.union(class2.vars)
+            if self._debug:
+                self._changes.append(("merge", lhs, rhs))
 
             for ref in class2.vars:
                 # All variables that map to the second equivalence class are to
@@ -285,7 +2164,7 @@ class Interpreter:
         """Unify two Oz values."""
         lhs = self._compute(env, lhs)
         rhs = self._compute(env, rhs)
-        logging.debug(f"unifying {lhs} & {rhs}")
+        logging.debug("unifying %s & %s", _Brief(lhs), _Brief(rhs))
 
         if type(lhs) is not type(rhs):
             raise TypeError("Values are not of the same type")
@@ -293,17 +2172,29 @@ class Interpreter:
         if type(lhs) is Proc:
             raise UnificationError("Procedures cannot match")
 
+        if type(lhs) is Port and lhs != rhs:
+            raise UnificationError("Ports do not match")
+
+        if type(lhs) in {Dictionary, Array} and lhs != rhs:
+            raise UnificationError(f"{type(lhs).__name__}s do not match")
+
+        if type(lhs) is Vector and not np.array_equal(lhs.array, rhs.array):
+            raise UnificationError("Vectors do not match")
+
         if type(lhs) is Literal and lhs.value != rhs.value:
             raise UnificationError("Literal values do not match")
 
         elif type(lhs) is Record:
+            if lhs.fields is rhs.fields and type(lhs.fields) is _GroundFields:
+                logging.debug("ground records are hash-consed to be equal")
+                return
             self._match_records(lhs, rhs)
             for key in lhs.fields:
                 self.unify(
                     env, lhs.fields[key], rhs.fields[key], marked=marked
                 )
 
-    def unify(self, env, lhs, rhs, marked={}):
+    def unify(self, env, lhs, rhs, marked=None):
         """Unify both input variables/values.
 
         Args:
@@ -312,12 +2203,15 @@ class Interpreter:
                 unification
             rhs (tuple): The RHS of a bind statement, or the second argument
                 for unification
-            marked (tuple):
+            marked (dict): The mapping of SAS variables already being unified
+                in this unification
 
         Raises:
             UnificationError: If the input operands cannot be unified
 
         """
+        if marked is None:
+            marked = {}
         var_types = {Ident, Variable}
 
         if type(lhs) in var_types and type(rhs) in var_types:  # <x> = <y>
@@ -337,40 +2231,313 @@ class Interpreter:
 
             value = self._compute(env, value)
             class1 = self.sas[var]
-            logging.debug(f"unifying {var} & {value}")
+            logging.debug("unifying %s & %s", var, _Brief(value))
 
             if not class1.is_bound():
-                class1.value = value
+                self._bind(class1, value)
             else:
                 self.unify(env, class1.value, value, marked=marked)
 
         else:  # <v> = <v>
             self._unify_values(env, lhs, rhs, marked=marked)
 
+    def _merge(self, class1, class2):
+        """Merge the waiting threads of two unbound equivalence classes."""
+        if class1.waiters is None:
+            class1.waiters = class2.waiters
+        elif class2.waiters is not None:
+            class1.waiters.extend(class2.waiters)
+
+    def _bind(self, eq_class, value):
+        """Bind an unbound equivalence class, waking up its waiting threads."""
+        eq_class.value = value
+        if self._debug:
+            self._changes.append(("bind", eq_class.vars, value))
+        if self._trace is not None:
+            self._trace.record(_BIND, min(eq_class.vars))
+            for thread in eq_class.waiters or ():
+                self._trace.record(_WAKE, thread.num)
+        if eq_class.waiters is not None:
+            self._woken.extend(eq_class.waiters)
+            eq_class.waiters = None
+        if self._inputs:
+            # An unread tail of an input is being bound, so it must match
+            # the rest of the input
+            self._read_input(eq_class)
+
     def _alloc_var(self, length=16):
         """Allocate a variable on the single-assignment store and return it."""
-        new = len(self.sas)
-        self.sas.append(_EqClass(new))
+        if self._free:
+            new = self._free.pop()
+            self.sas[new] = _EqClass(new)
+        else:
+            new = len(self.sas)
+            self.sas.append(_EqClass(new))
+        if self._debug:
+            self._changes.append(("new", new))
         return new
 
-    def _if_stmt(self, stmt, env):
-        """Process a suspendable Oz if-else statement.
+    def _input_stmt(self, stmt, env):
+        """Process an Oz statement binding a variable to an input file.
 
         Args:
-            stmt (tuple): The Oz if-else statement's AST
+            stmt (tuple): The Oz input statement's AST
             env (dict): The current variable environment
 
+        """
+        width = stmt[3] if len(stmt) > 3 else None
+        if width is not None and (type(width) is not int or width <= 0):
+            raise ValueError(f"{width} is an invalid width of records")
+        logging.info("input from %s into: %s", stmt[2], stmt[1].name)
+
+        source = _InputSource(stmt[2], width)
+        self._sources.append(source)
+        if self._collect_at is None:
+            self._collect_at = len(self.sas) + _COLLECT_MIN
+        var = self._alloc_var()
+        self._inputs[var] = (source, 0)
+        self.unify(env, stmt[1], Variable(var))
+
+    def _read_input(self, eq_class):
+        """Read the next item of an input whose tail is in a class, if any.
+
+        The tail is bound to a list cell whose own tail is the unread rest
+        of the input, or to nil at the end of the input.
+
+        Args:
+            eq_class (`_EqClass`): The equivalence class
+
         Returns:
-            tuple: The resulting statement to be pushed onto the stack
+            bool: Whether an item was read
+
+        """
+        for var in eq_class.vars:
+            if var in self._inputs:
+                break
+        else:
+            return False
+
+        source, offset = self._inputs.pop(var)
+        item = source.read(offset)
+        if item is None:
+            value = Literal(None)
+        else:
+            tail = self._alloc_var()
+            self._inputs[tail] = (source, item[1])
+            value = Record(_CONS, {_HEAD: item[0], _TAIL: Variable(tail)})
+        logging.debug("read from input into %s: %s", var, _Brief(value))
+        self.unify({}, Variable(var), value)
+        return True
+
+    def _collect(self, scheduler):
+        """Free the variables of the SAS that can't be reached any more.
+
+        This is only done for programs reading inputs, so that the items
+        consumed from them (and the variables used to consume them) are
+        dropped, and their variables reused. Variables are reachable from the
+        environments of live threads (only for the identifiers that the rest
+        of their statements use), from port streams, dictionaries, arrays &
+        memoized results, through the values bound to them.
+
+        Args:
+            scheduler (`_Scheduler`): The scheduler with the threads
+
+        """
+        pending = list(self._ports.values())  # variables to be marked
+        values = []  # values whose variables are to be marked
+        for entries in self._dictionaries.values():
+            values.extend(entries.values())
+        for _, cells in self._arrays.values():
+            values.extend(cells)
+        for proc, outputs in self._memo.values():
+            values.append(proc)
+            values.extend(value for _, value in outputs)
+        for thread in self._live_threads(scheduler) + self._woken:
+            for seq, index, env in [thread.frame, *(thread.stack or ())]:
+                if seq[0][0] == "_memo":
+                    pending.extend(seq[0][2])
+                    values.append(seq[0][3])
+                    continue
+                for stmt in seq[index:]:
+                    if id(stmt) not in self._stmt_fvars:
+                        # Kept with the stmt, so that its ID isn't reused
+                        fvars = self.get_fvars(stmt)
+                        self._stmt_fvars[id(stmt)] = (stmt, fvars)
+                    fvars = self._stmt_fvars[id(stmt)][1]
+                    pending.extend(env[name] for name in fvars if name in env)
+        # Start frames of threads are cached, keeping their envs alive, and
+        # procedures are cached by their variables, which may be reused
+        scheduler.spawned.clear()
+        self._call_sites.clear()
+
+        marked = set()  # IDs of the reachable equivalence classes
+        while pending or values:
+            if pending:
+                eq_class = self.sas[pending.pop()]
+                if id(eq_class) not in marked:
+                    marked.add(id(eq_class))
+                    if eq_class.is_bound():
+                        values.append(eq_class.value)
+                continue
+
+            value = values.pop()
+            if type(value) is Variable:
+                pending.append(value.name)
+            elif type(value) is Record:
+                if type(value.fields) is not _GroundFields:
+                    values.extend(value.fields.values())
+            elif type(value) is Proc:
+                pending.extend(value.ctxenv.values())
+
+        for var, eq_class in enumerate(self.sas):
+            if eq_class is not None and id(eq_class) not in marked:
+                self.sas[var] = None
+                self._free.append(var)
+                # Inputs that can't be read any more are dropped too
+                self._inputs.pop(var, None)
+
+        live = len(self.sas) - len(self._free)
+        logging.info("collected %s variables, %s live", len(self._free), live)
+        self._collect_at = live + max(live, _COLLECT_MIN)
+
+    def _new_port(self, stream):
+        """Create a port whose stream starts at the given SAS variable."""
+        port = Port(len(self._ports))
+        self._ports[port.name] = stream
+        return port
+
+    def _port_send(self, port, value):
+        """Append a value to the stream of a port.
+
+        The port keeps the unbound tail of its stream, so this doesn't depend
+        on the length of the stream. Threads reading the stream are woken up
+        by binding the tail.
+
+        Args:
+            port (tuple): The port value
+            value (tuple): The computed value to be sent
+
+        """
+        tail = self._ports[port.name]
+        new_tail = self._ports[port.name] = self._alloc_var()
+        cons = Record(_CONS, {_HEAD: value, _TAIL: Variable(new_tail)})
+        logging.debug("sending to port %s: %s", port.name, _Brief(value))
+        self.unify({}, Variable(tail), cons)
+
+    def _send_stmt(self, stmt, env):
+        """Process a suspendable Oz send statement.
+
+        Args:
+            stmt (tuple): The Oz send statement's AST
+            env (dict): The current variable environment
 
         """
         ident = stmt[1].name
-        logging.info(f"if-else on: {ident}")
+        logging.info("sending to: %s", ident)
         eq_class = self.sas[env[ident]]
         if not eq_class.is_bound():
             raise UnboundVariableError(f"{ident} is unbound", env[ident])
+        elif type(eq_class.value) is not Port:
+            raise TypeError(f"{ident} is not a port")
+        self._port_send(eq_class.value, self._compute(env, stmt[2]))
+
+    def _new_dictionary(self):
+        """Create an empty dictionary."""
+        dictionary = Dictionary(len(self._dictionaries))
+        self._dictionaries[dictionary.name] = {}
+        return dictionary
+
+    def _new_array(self, low, high, init):
+        """Create an array with the given bounds & initial value of cells."""
+        if any(
+            type(bound) is not Literal or type(bound.value) is not int
+            for bound in (low, high)
+        ):
+            raise TypeError("Arrays can only have integer bounds")
+        elif high.value < low.value - 1:
+            raise ValueError(f"{low.value}..{high.value} are invalid bounds")
+        array = Array(len(self._arrays))
+        cells = [init] * (high.value - low.value + 1)
+        self._arrays[array.name] = (low.value, cells)
+        return array
+
+    def _entity_op(self, kind, op, args):
+        """Run an operation on a dictionary or an array.
+
+        Each operation runs in a single step of a thread, so operations by
+        different threads take effect one at a time, in the order in which
+        they are scheduled.
+
+        Args:
+            kind (str): "dictionary" or "array"
+            op (str): The operation
+            args (list): The computed arguments, without the result
+
+        Returns:
+            tuple: The result of the operation, if it has one
+
+        """
+        if op == "new" and kind == "dictionary":
+            return self._new_dictionary()
+        elif op == "new":
+            return self._new_array(*args)
+
+        entity = args[0]
+        if kind == "dictionary":
+            if type(entity) is not Dictionary:
+                raise TypeError(f"{_show(entity)} is not a dictionary")
+            entries = self._dictionaries[entity.name]
+            return _dictionary_op(entries, op, args[1:])
+        else:
+            if type(entity) is not Array:
+                raise TypeError(f"{_show(entity)} is not an array")
+            low, cells = self._arrays[entity.name]
+            return _array_op(low, cells, op, args[1:])
+
+    def _entity_stmt(self, stmt, env):
+        """Process a suspendable Oz dictionary or array statement.
+
+        Args:
+            stmt (tuple): The Oz statement's AST
+            env (dict): The current variable environment
+
+        """
+        kinds = _entity_kinds(stmt)
+        if kinds is None:
+            raise ValueError(f"{stmt} is an invalid {stmt[0]} statement")
+        logging.info("%s operation: %s", stmt[0], stmt[1])
+
+        args = []
+        for kind, arg in zip(kinds, stmt[2:]):
+            if kind == "value":
+                args.append(self._compute(env, arg))
+            elif kind != "result":
+                args.append(self._operand(env, arg))
+        result = self._entity_op(stmt[0], stmt[1], args)
+        if kinds[-1] == "result":
+            self.unify(env, stmt[-1], result)
+
+    def _if_stmt(self, stmt, env):
+        """Process a suspendable Oz if-else statement.
+
+        Args:
+            stmt (tuple): The Oz if-else statement's AST
+            env (dict): The current variable environment
+
+        Returns:
+            tuple: The resulting statement to be pushed onto the stack
+
+        """
+        if type(stmt[1]) is Literal:  # condition is known statically
+            ident = cond = stmt[1]
+        else:
+            ident = stmt[1].name
+            eq_class = self.sas[env[ident]]
+            if not eq_class.is_bound():
+                raise UnboundVariableError(f"{ident} is unbound", env[ident])
+            cond = eq_class.value
+        logging.info("if-else on: %s", ident)
 
-        cond = eq_class.value
         if type(cond) is not Literal or type(cond.value) is not bool:
             raise TypeError(f"{ident} is not a boolean")
         elif cond.value:
@@ -391,7 +2558,7 @@ class Interpreter:
 
         """
         ident = stmt[1].name
-        logging.info(f"case on: {ident}")
+        logging.info("case on: %s", ident)
 
         eq_class = self.sas[env[ident]]
         if not eq_class.is_bound():
@@ -409,11 +2576,11 @@ class Interpreter:
 
         except (TypeError, UnificationError):
             # Either not a record, or doesn't match
-            logging.debug(f"{ident} doesn't match pattern")
+            logging.debug("%s doesn't match pattern", ident)
             return stmt[4], env
 
         else:
-            logging.debug(f"{ident} matches pattern")
+            logging.debug("%s matches pattern", ident)
 
             # Avoid editing environments of other statements in the
             # stack.
@@ -422,10 +2589,294 @@ class Interpreter:
                 if type(item) is Ident:
                     new_env[item.name] = self._alloc_var()
                     self.unify(new_env, item, eq_class.value.fields[feat])
-            logging.debug(f"env for case: {pformat(new_env)}")
+            logging.debug("env for case: %s", new_env)
 
             return stmt[3], new_env
 
+    def _invoke(self, proc, name, argvars, depth=0):
+        """Call a procedure value with the given SAS variables as arguments.
+
+        Calls of tabled procedures are looked up in the memo first.
+
+        Args:
+            proc (tuple): The procedure value
+            name (str): The name of the procedure, for debugging purposes
+            argvars (tuple): The SAS variables passed as arguments
+            depth (int): The nesting depth of compiled calls
+
+        Returns:
+            list: The resulting entries to be pushed onto the stack, which is
+                empty if the call ran to completion
+
+        """
+        if type(proc) is not Proc:
+            raise TypeError(f"{name} is not a procedure")
+        elif len(proc.args) != len(argvars):
+            raise TypeError(f"No. of arguments do not match arity of {name}")
+        return self._enter(proc, name, argvars, depth)
+
+    def _enter(self, proc, name, argvars, depth=0):
+        """Call a checked procedure, with the same arguments as `_invoke`."""
+        key = None
+        if proc.tabled and self.memo_size > 0:
+            key = self._memo_key(proc, argvars)
+        if key is None:
+            return self._call(proc, name, argvars, depth)
+
+        if key in self._memo:
+            self._memo_hit(key, argvars)
+            return []
+        self.memo_stats["misses"] += 1
+        frames = self._call(proc, name, argvars, depth)
+        if not frames:
+            self._memo_store(key, argvars, proc)
+            return []
+        # Store the result once the rest of the body has run
+        self._memo_calls += 1
+        return [_frame(("_memo", key, argvars, proc), {})] + frames
+
+    def _call(self, proc, name, argvars, depth):
+        """Run the body of a procedure, with the same arguments as `_invoke`.
+
+        Procedure bodies are interpreted until they have been called enough
+        times, after which they are compiled and run directly. Compiled code
+        doesn't log the changes it makes to the SAS, so they're always
+        interpreted when debugging.
+        """
+        if (
+            self.jit_threshold is not None
+            and depth < _MAX_JIT_DEPTH
+            and not self._debug
+        ):
+            key = (id(proc.args), id(proc.contents))
+            if key in self._compiled:
+                compiled = self._compiled[key][1]
+            else:
+                count = self._call_counts.get(key, 0) + 1
+                self._call_counts[key] = count
+                compiled = None
+                if count >= self.jit_threshold:
+                    compiled = self._compile(proc, name)
+                    # Keep the AST alive, as the cache is keyed by its ID
+                    self._compiled[key] = (proc, compiled)
+                    del self._call_counts[key]
+
+            if compiled is not None:
+                return compiled(self, proc.ctxenv, argvars, depth)
+
+        # Avoid editing the contextual environment by reference, whose values
+        # are just numbers of SAS variables
+        new_env = dict(proc.ctxenv)
+        for arg, var in zip(proc.args, argvars):
+            new_env[arg.name] = var
+        logging.debug("call env: %s", new_env)
+
+        return [_frame(proc.contents, new_env)]
+
+    def _ground_key(self, value, path=frozenset()):
+        """Get a hashable key for the structure of a ground value.
+
+        Args:
+            value (tuple): The computed Oz value, or SAS variable
+            path (frozenset): The SAS variables followed to reach this value,
+                for detecting cyclic values
+
+        Returns:
+            tuple: The key, or None if the value isn't ground
+
+        """
+        if type(value) is Variable:
+            eq_class = self.sas[value.name]
+            if not eq_class.is_bound() or value.name in path:
+                return None
+            return self._ground_key(eq_class.value, path | {value.name})
+
+        elif type(value) is Literal:
+            return _literal_key(value)
+
+        elif type(value) is Record:
+            parts = []
+            for feat, val in value.fields.items():
+                part = self._ground_key(val, path)
+                if part is None:
+                    return None
+                parts.append((_literal_key(feat), part))
+            return _literal_key(value.literal), frozenset(parts)
+
+        elif type(value) is Vector:
+            return "vector", value.array.dtype.str, value.array.tobytes()
+
+        else:  # procedures are compared by identity, and ports, dictionaries
+            # & arrays have effects that memoized calls would skip
+            return None
+
+    def _memo_key(self, proc, argvars):
+        """Get the key of a call of a tabled procedure in the memo.
+
+        Arguments that are bound are the inputs, and must be ground, and
+        those that aren't are the outputs. The closure must be bound too.
+
+        Args:
+            proc (tuple): The procedure value
+            argvars (tuple): The SAS variables passed as arguments
+
+        Returns:
+            tuple: The key, or None if the call can't be memoized
+
+        """
+        if not self._check_closure(proc):
+            return None
+        parts = []
+        for var in argvars:
+            if self.sas[var].is_bound():
+                part = self._ground_key(Variable(var))
+                if part is None:
+                    return None
+            else:
+                part = None  # an output
+            parts.append(part)
+
+        key = id(proc), tuple(parts)
+        try:
+            hash(key)
+        except TypeError:  # unhashable literal values
+            return None
+        return key
+
+    def _check_closure(self, proc):
+        """Check that a tabled procedure's closure has no effects.
+
+        The values reachable from the contextual environment mustn't be ports,
+        dictionaries or arrays, or procedures whose bodies have effects, as
+        memoized calls would skip what the body does with them. Closures that
+        are bound can't change, so they're only checked once.
+
+        Args:
+            proc (tuple): The procedure value
+
+        Returns:
+            bool: Whether the closure is bound, so that the call can be
+                memoized
+
+        Raises:
+            ValueError: If the closure reaches values with effects
+
+        """
+        if id(proc) in self._pure_closures:
+            return True
+        bound = True
+        seen = set()
+        stack = [Variable(var) for var in proc.ctxenv.values()]
+        while stack:
+            value = stack.pop()
+            if type(value) is Variable:
+                if value.name in seen:
+                    continue
+                seen.add(value.name)
+                eq_class = self.sas[value.name]
+                if eq_class.is_bound():
+                    stack.append(eq_class.value)
+                else:
+                    bound = False
+
+            elif type(value) is Record:
+                stack.extend(value.fields.values())
+
+            elif type(value) is Proc:
+                effects = self._effects.get(id(value.contents))
+                if effects is None:
+                    # Kept with the body, so that its ID isn't reused
+                    effects = (value.contents, _has_effects(value.contents))
+                    self._effects[id(value.contents)] = effects
+                if effects[1]:
+                    raise ValueError(
+                        "Tabled procedures can't call procedures using ports,"
+                        " dictionaries or arrays"
+                    )
+                stack.extend(Variable(var) for var in value.ctxenv.values())
+
+            elif type(value) in {Port, Dictionary, Array}:
+                raise ValueError(
+                    "Tabled procedures can't use ports, dictionaries or arrays"
+                )
+
+        if bound:
+            # Kept with the ID, so that it isn't reused
+            self._pure_closures[id(proc)] = proc
+        return bound
+
+    def _memo_wait(self, thread, eq_class):
+        """Mark the running tabled calls of a thread that wait for arguments.
+
+        Arguments that are unbound when called are taken as outputs, so calls
+        waiting for them get their inputs from other threads. Their results
+        depend on those threads, and so aren't memoized.
+
+        Args:
+            thread (`_Thread`): The thread that's been suspended
+            eq_class (`_EqClass`): The class of the variable waited for
+
+        """
+        for seq, _, _ in thread.stack:
+            stmt = seq[0]
+            if stmt[0] == "_memo" and any(
+                self.sas[var] is eq_class for var in stmt[2]
+            ):
+                # Kept with the entry, so that its ID isn't reused
+                self._memo_waits[id(stmt)] = stmt
+
+    def _memo_hit(self, key, argvars):
+        """Bind the outputs of a memoized call from the memo."""
+        logging.debug("memoized call: %s", _Brief(key))
+        self.memo_stats["hits"] += 1
+        self._memo.move_to_end(key)
+        _, outputs = self._memo[key]
+        for index, value in outputs:
+            self.unify({}, Variable(argvars[index]), value)
+
+    def _memo_store(self, key, argvars, proc):
+        """Store the outputs of a completed call of a tabled procedure.
+
+        Outputs that aren't ground by the time the call completes (eg. as
+        another thread binds them) aren't memoized.
+
+        Args:
+            key (tuple): The key of the call in the memo
+            argvars (tuple): The SAS variables passed as arguments
+            proc (tuple): The procedure value, which is kept alive as it's
+                identified by its ID in the key
+
+        """
+        outputs = []
+        for index, part in enumerate(key[1]):
+            if part is not None:
+                continue
+            var = argvars[index]
+            if self._ground_key(Variable(var)) is None:
+                logging.debug(
+                    "not memoizing call with unbound output: %s", _Brief(key)
+                )
+                return
+            outputs.append((index, self.sas[var].value))
+
+        self._memo[key] = (proc, tuple(outputs))
+        self._memo.move_to_end(key)
+        if len(self._memo) > self.memo_size:
+            self._memo.popitem(last=False)
+            self.memo_stats["evictions"] += 1
+
+    def _compile(self, proc, name):
+        """Compile a procedure's body, returning None if not possible."""
+        try:
+            compiled = _ProcCompiler(self).compile(proc, name)
+        except (KeyError, TypeError, ValueError, NotImplementedError) as ex:
+            # The generic path raises the same errors when it's run
+            logging.info("not compiling %s: %r", name, ex)
+            return None
+        else:
+            logging.info("compiled hot procedure: %s", name)
+            return compiled
+
     def _apply_stmt(self, stmt, env):
         """Process a suspendable Oz procedure call.
 
@@ -434,68 +2885,92 @@ class Interpreter:
             env (dict): The current variable environment
 
         Returns:
-            tuple: The resulting statement to be pushed onto the stack
-            dict: The resulting environment to be pushed onto the stack
+            list: The resulting entries to be pushed onto the stack
 
         """
         proc = stmt[1].name
-        logging.info(f"calling: {proc}")
-        eq_class = self.sas[env[proc]]
+        logging.info("calling: %s", proc)
+        var = env[proc]
+        site = self._call_sites.get(id(stmt))
+        if site is not None and site[1] == var:
+            # Bound variables never change, so this is the same procedure,
+            # which has already been checked
+            argvars = tuple(env[name] for name in site[3])
+            return self._enter(site[2], proc, argvars)
+
+        eq_class = self.sas[var]
         if not eq_class.is_bound():
-            raise UnboundVariableError(f"{proc} is unbound", env[proc])
-
-        value = eq_class.value
-        if type(value) is not Proc:
-            raise TypeError(f"{proc} is not a procedure")
-        elif len(value.args) != len(stmt) - 2:
-            raise TypeError(f"No. of arguments do not match arity of {proc}")
-
-        # Avoid editing the contextual environment by reference
-        new_env = deepcopy(value.ctxenv)
-        for arg, param in zip(value.args, stmt[2:]):
-            new_env[arg.name] = env[param.name]
-        logging.debug(f"call env: {new_env}")
+            raise UnboundVariableError(f"{proc} is unbound", var)
 
-        return value.contents, new_env
+        names = tuple(param.name for param in stmt[2:])
+        argvars = tuple(env[name] for name in names)
+        frames = self._invoke(eq_class.value, proc, argvars)
+        # Kept with the stmt, so that its ID isn't reused
+        self._call_sites[id(stmt)] = (stmt, var, eq_class.value, names)
+        return frames
 
-    def _exec_stmt(self, stack, stmt, env):
-        """Process an Oz statement."""
+    def _exec_stmt(self, thread, stmt, env):
+        """Process an Oz statement, pushing new frames on the given thread."""
         if stmt[0] == "nop":
             logging.info("skip statement")
 
         elif type(stmt[0]) is list:
-            logging.info(f"combined statement of {len(stmt)} sub-statements")
-            for sub_stmt in reversed(stmt):
-                stack.append((sub_stmt, env))
+            logging.info("combined statement of %s sub-statements", len(stmt))
+            thread.push([(stmt, 0, env)])
 
         elif stmt[0] == "var":
-            logging.info(f"local statement with var: {stmt[1].name}")
+            logging.info("local statement with var: %s", stmt[1].name)
 
             # Avoid editing envs of other statements in the stack
             new_env = deepcopy(env)
             new_env[stmt[1].name] = self._alloc_var()
 
-            logging.debug(f"new env: {pformat(new_env)}")
-            logging.debug(f"sas: {pformat(self.sas)}")
-            stack.append((stmt[2], new_env))
+            logging.debug("new env: %s", new_env)
+            thread.push([_frame(stmt[2], new_env)])
 
         elif stmt[0] == "bind":
-            logging.info(f"binding lhs: {stmt[1]} & rhs: {stmt[2]}")
-            logging.debug(f"env: {pformat(env)}")
-            logging.debug(f"sas before: {pformat(self.sas)}")
+            logging.info(
+                "binding lhs: %s & rhs: %s", _Brief(stmt[1]), _Brief(stmt[2])
+            )
+            logging.debug("env: %s", env)
             self.unify(env, stmt[1], stmt[2])
-            logging.debug(f"sas after: {pformat(self.sas)}")
 
         elif stmt[0] == "conditional":
             # The environment doesn't change, so this function is
             # made to not return the environment.
-            stack.append((self._if_stmt(stmt, env), env))
+            thread.push([_frame(self._if_stmt(stmt, env), env)])
 
         elif stmt[0] == "match":
-            stack.append(self._match_stmt(stmt, env))
+            thread.push([_frame(*self._match_stmt(stmt, env))])
 
         elif stmt[0] == "apply":
-            stack.append(self._apply_stmt(stmt, env))
+            thread.push(self._apply_stmt(stmt, env))
+
+        elif stmt[0] == "input":
+            self._input_stmt(stmt, env)
+
+        elif stmt[0] == "newport":
+            logging.info(
+                "new port: %s, stream: %s", stmt[2].name, stmt[1].name
+            )
+            port = self._new_port(env[stmt[1].name])
+            self.unify(env, stmt[2], port)
+
+        elif stmt[0] == "send":
+            self._send_stmt(stmt, env)
+
+        elif stmt[0] in {"dictionary", "array"}:
+            self._entity_stmt(stmt, env)
+
+        elif stmt[0] == "_memo":  # a tabled procedure's call has completed
+            self._memo_calls -= 1
+            if self._memo_waits.pop(id(stmt), None) is None:
+                self._memo_store(*stmt[1:])
+            else:
+                logging.debug(
+                    "not memoizing call that waited for its arguments: %s",
+                    _Brief(stmt[1]),
+                )
 
         else:
             raise ValueError(f"{stmt} is an invalid statement")
@@ -503,65 +2978,329 @@ class Interpreter:
     def run(self, ast):
         """Run the given Oz AST."""
         self.sas = []  # clear the interpreter
-        thr_queue = Queue()
-        thr_count = 0  # for debugging
-
-        # Initialize the main thread with an empty env
-        thr_queue.put(_Thread(thr_count, [(ast, {})]))
-        thr_count += 1
-
-        global_tick = 0  # time counter
-        change_tick = 0
-
-        while not thr_queue.empty():
-            global_tick += 1
-            thread = thr_queue.get()
-            old_tick = thread.tick
-            thread.tick = global_tick
-            logging.debug(f"processing thread: {thread.num}")
-
-            if thread.suspension is not None:
-                # Checking if thread can be resumed
-                logging.info(
-                    f"thread {thread.num} suspended on: {thread.suspension}"
-                )
-                logging.debug(f"sas: {pformat(self.sas)}")
-                eq_class = self.sas[thread.suspension]
-                if eq_class.is_bound():
-                    thread.suspension = None
-                else:
-                    if change_tick < old_tick:
-                        # Last change in the multi-stack is before this thread
-                        # was last checked. Thus, this thread is appearing
-                        # for the second time after the last change in the
-                        # multi-stack.
-                        raise DeadlockError
-                    thr_queue.put(thread)
-                    continue
-
-            stmt, env = thread.stack.pop()
+        self._woken = []
+        self._ports = {}
+        self._dictionaries = {}
+        self._arrays = {}
+        self._inputs = {}
+        self._sources = []
+        self._free = []
+        self._collect_at = None
+        self._stmt_fvars = {}
+        self._stmt_opers = {}
+        self._effects = {}
+        self._pure_closures = {}
+        self._call_sites = {}
+        self._debug = logging.getLogger().isEnabledFor(logging.DEBUG)
+        self._changes = []
+        self._ground = WeakValueDictionary()
+        # Results refer to variables of the SAS, so they're only kept per run
+        self.memo_stats = Counter()
+        self._memo = OrderedDict()
+        self._memo_calls = 0
+        self._memo_waits = {}
+        ast = self._optimize(ast)
+        if self.replay is None:
+            scheduler = _Scheduler(self.priority_shares)
+        else:
+            with open(self.replay, "rb") as replay_file:
+                switches = [
+                    (tick, thread)
+                    for kind, tick, thread, _ in read_trace(replay_file)
+                    if kind == "switch"
+                ]
+            scheduler = _ReplayScheduler(switches, self.priority_shares)
+        self._scheduler = scheduler
+
+        trace_file = None
+        if self.trace is not None:
+            trace_file = open(self.trace, "wb")
+            self._trace = TraceRecorder(trace_file)
 
-            if stmt[0] == "thread":
-                logging.info(f"creating new thread with no: {thr_count}")
-                thr_queue.put(_Thread(thr_count, [(stmt[1], env)]))
-                change_tick = global_tick
-                thr_count += 1
+        try:
+            # Initialize the main thread with an empty env
+            self._spawn(scheduler, _frame(ast, {}), "medium")
 
-            else:
+            if self.mem_interval is None:
+                self.mem_report = None
                 try:
-                    self._exec_stmt(thread.stack, stmt, env)
-                except UnboundVariableError as ex:
-                    logging.info(f"thread {thread.num} suspended on: {ex.var}")
-                    thread.suspension = ex.var
-                    # Restore the popped stmt and env.
-                    # NOTE: This assumes that no state (stack, env or sas)
-                    # was altered before detecting the unbound variable
-                    thread.stack.append((stmt, env))
-                else:
-                    change_tick = global_tick
+                    self._schedule(scheduler)
+                finally:
+                    self.sched_stats = scheduler.summary()
+            else:
+                self._schedule_traced(scheduler)
+
+        finally:
+            for source in self._sources:
+                source.close()
+            if trace_file is not None:
+                self._trace.record(_END, scheduler.parked)
+                self._trace.flush()
+                self._trace = None
+                trace_file.close()
+
+        if scheduler.parked > 0:
+            # No thread can run, but some are still waiting for variables
+            raise DeadlockError
+
+    def _optimize(self, ast):
+        """Optimize an AST statically before running it, if enabled."""
+        if not self.optimize:
+            return ast
+        optimizer = _Optimizer()
+        ast = optimizer.optimize(ast)
+        self.opt_report = optimizer.report
+        logging.info("optimizer reductions: %s", dict(self.opt_report))
+        return ast
+
+    def describe_var(self, var):
+        """Get the full state of a variable of the SAS, for debugging.
+
+        The variables inside its value are replaced by their own values, so
+        this takes time in the size of the whole value.
+
+        Args:
+            var (int): The SAS variable
+
+        Returns:
+            str: The value, the variables in the same equivalence class and
+                the threads waiting for them
+
+        """
+        if not 0 <= var < len(self.sas):
+            return f"variable {var}: not allocated"
+        eq_class = self.sas[var]
+        if eq_class is None:
+            return f"variable {var}: collected"
+        elif eq_class.is_bound():
+            value = _show(self._resolve(eq_class.value, (var,)))
+        else:
+            value = "unbound"
+        waiters = sorted(thread.num for thread in eq_class.waiters or ())
+        return (
+            f"variable {var}: {value}, equal to {sorted(eq_class.vars)},"
+            f" waited for by threads {waiters}"
+        )
+
+    def _resolve(self, value, path):
+        """Replace the bound variables inside a computed value by their values.
+
+        Args:
+            value (tuple): The computed Oz value
+            path (tuple): The variables already replaced to reach this value,
+                where cycles stop
+
+        Returns:
+            tuple: The value with its bound variables replaced
 
-            if len(thread.stack) > 0:
-                logging.debug(f"thread {thread.num} is incomplete")
-                thr_queue.put(thread)
+        """
+        if type(value) is Record:
+            fields = {
+                feat: self._resolve(val, path)
+                for feat, val in value.fields.items()
+            }
+            return Record(value.literal, fields)
+        elif (
+            type(value) is not Variable
+            or value.name in path
+            or len(path) > _DESCRIBE_DEPTH
+        ):
+            return value
+        eq_class = self.sas[value.name]
+        if eq_class is None or not eq_class.is_bound():
+            return value
+        return self._resolve(eq_class.value, path + (value.name,))
+
+    def describe_thread(self, num):
+        """Get the full state of a thread of the last run, for debugging.
+
+        Args:
+            num (int): The thread no.
+
+        Returns:
+            str: The variable that the thread waits for, if any, and its
+                frames from the top down, with the statement at which each
+                one is and the variables of its environment
+
+        """
+        waiting = {}  # the variable waited for by each parked thread
+        eq_classes = {
+            id(eq_class): eq_class
+            for eq_class in self.sas
+            if eq_class is not None  # collected
+        }
+        for eq_class in eq_classes.values():
+            for thread in eq_class.waiters or ():
+                waiting[thread] = min(eq_class.vars)
+        threads = list(waiting)
+        if self._scheduler is not None:
+            threads.extend(self._scheduler.threads())
+
+        for thread in threads:
+            if thread.num == num:
+                break
+        else:
+            return f"thread {num}: not running"
+        if thread in waiting:
+            state = f"waiting for {waiting[thread]}"
+        else:
+            state = "runnable"
+        lines = [f"thread {num} ({thread.priority}): {state}"]
+        for seq, index, env in reversed(thread.frames()):
+            stmt = seq[index]
+            kind = "combined" if type(stmt[0]) is list else stmt[0]
+            names = ", ".join(
+                f"{name}={var}" for name, var in sorted(env.items())
+            )
+            lines.append(f"  at {kind} statement {index}, env: {{{names}}}")
+        return "\n".join(lines)
+
+    def _schedule_traced(self, scheduler):
+        """Run the threads in the given scheduler, sampling memory usage."""
+        self.mem_report = MemoryReport(self.mem_interval)
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start(25)  # deep enough to reach the interpreter
+        try:
+            self._schedule(scheduler)
+        finally:
+            self.sched_stats = scheduler.summary()
+            # Also sample the state at the end, even on errors like deadlocks
+            self.mem_report.sample(
+                self.mem_report.last_tick,
+                self.sas,
+                self._live_threads(scheduler),
+            )
+            if started_tracing:
+                tracemalloc.stop()
+
+    def _live_threads(self, scheduler):
+        """Get a list of the threads in the given scheduler or parked."""
+        threads = scheduler.threads()
+        eq_classes = {
+            id(eq_class): eq_class
+            for eq_class in self.sas
+            if eq_class is not None  # collected
+        }
+        for eq_class in eq_classes.values():
+            threads.extend(eq_class.waiters or [])
+        return threads
+
+    def _spawn(self, scheduler, frame, priority):
+        """Create a thread starting with the given frame."""
+        logging.info(
+            "creating new thread with no: %s (%s)",
+            scheduler.thr_count,
+            priority,
+        )
+        thread = _Thread(scheduler.thr_count, frame, priority)
+        scheduler.put(thread, scheduler.tick)
+        if self._trace is not None:
+            self._trace.record(_SPAWN, thread.num)
+        scheduler.thr_count += 1
+
+    def _wake(self, scheduler):
+        """Put the threads woken up by bindings back in the run queues."""
+        for thread in self._woken:
+            logging.info("thread %s resumed", thread.num)
+            scheduler.put(thread, scheduler.tick)
+        scheduler.parked -= len(self._woken)
+        self._woken.clear()
+
+    def _step(self, scheduler, thread, stmt):
+        """Run the next statement of a thread, whose operands are bound."""
+        # Advance the sequence on top of the stack past the statement
+        seq, index, env = thread.frame
+        if index + 1 < len(seq):
+            thread.frame = (seq, index + 1, env)
+        elif thread.stack:
+            thread.frame = thread.stack.pop()
+        else:
+            thread.frame = None
+
+        if stmt[0] == "thread":
+            # Child threads inherit the priority of their parent
+            priority = stmt[2] if len(stmt) > 2 else thread.priority
+            if priority not in PRIORITIES:
+                raise ValueError(f"{priority} is an invalid priority")
+            start = scheduler.spawned.get(id(stmt))
+            if start is None or start[2] is not env:
+                start = _frame(stmt[1], env)
+                scheduler.spawned[id(stmt)] = start
+            self._spawn(scheduler, start, priority)
+        else:
+            self._exec_stmt(thread, stmt, env)
+
+    def _schedule(self, scheduler, max_steps=None):
+        """Run the threads in the given scheduler until none can run.
+
+        Args:
+            scheduler (`_Scheduler`): The scheduler with the threads
+            max_steps (int): The maximum no. of steps to run, or None to run
+                until all threads are complete or parked
+
+        """
+        report = self.mem_report
+        trace = self._trace
+        stop_tick = None if max_steps is None else scheduler.tick + max_steps
+
+        while len(scheduler) > 0 and scheduler.tick != stop_tick:
+            scheduler.tick += 1
+            thread = scheduler.get(scheduler.tick)
+            logging.debug(
+                "processing thread: %s (%s)", thread.num, thread.priority
+            )
+            if trace is not None:
+                trace.step(scheduler.tick, thread.num)
+
+            seq, index, env = thread.frame
+            stmt = seq[index]
+            var = self._blocker(stmt, env)
+            if var is not None:
+                # Park the thread, still on the statement, until the variable
+                # is bound
+                logging.info("thread %s suspended on: %s", thread.num, var)
+                eq_class = self.sas[var]
+                if eq_class.waiters is None:
+                    eq_class.waiters = []
+                eq_class.waiters.append(thread)
+                scheduler.parked += 1
+                if self._memo_calls > 0 and thread.stack:
+                    self._memo_wait(thread, eq_class)
+                if trace is not None:
+                    trace.record(_SUSPEND, var)
+            else:
+                self._step(scheduler, thread, stmt)
+                if self._changes:
+                    # Rendered only if the log record is emitted
+                    delta = _StoreDelta(self._changes)
+                    logging.debug("store changes: %s", delta)
+                    self._changes = []
+
+            if var is not None:
+                logging.debug("thread %s is parked", thread.num)
+            elif thread.frame is not None:
+                logging.debug("thread %s is incomplete", thread.num)
+                scheduler.put(thread, scheduler.tick)
             else:
-                logging.debug(f"thread {thread.num} is complete")
+                logging.debug("thread %s is complete", thread.num)
+                if trace is not None:
+                    trace.record(_FINISH)
+
+            if self._woken:
+                self._wake(scheduler)
+
+            if (
+                self._collect_at is not None
+                and len(self.sas) - len(self._free) >= self._collect_at
+            ):
+                self._collect(scheduler)
+
+            if report is not None:
+                report.observe(
+                    scheduler.tick,
+                    self.sas,
+                    len(scheduler) + scheduler.parked,
+                    thread,
+                    lambda: self._live_threads(scheduler),
+                )
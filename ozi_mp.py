@@ -0,0 +1,537 @@
+"""Experimental multi-process execution of the Oz kernel language's AST.
+
+Oz threads are distributed over worker processes, each of which runs an
+interpreter with its own part of the single-assignment store. Every SAS
+variable is owned by the worker that allocated it, and is numbered such that
+its owner is known from its number alone. Other workers keep replicas of the
+variables that they use, which are kept up to date by messages:
+
+* "subscribe": A worker asks the owner for the value of a variable, which
+    the owner sends once the variable is bound.
+* "bound": The owner sends the value of a variable to its subscribers.
+* "unify": A worker sends a binding of a variable (to a value or to another
+    variable) to its owner.
+* "spawn": A worker hands a new thread over to another worker.
+* "send": A worker sends a value to a port, through the worker owning the
+    port, which keeps the tail of its stream.
+
+All messages between workers are routed through the coordinator (the parent
+process), which thus knows when no worker can run and no message is in
+flight. Without ports, the kernel language is deterministic, so the store at
+that point is the same as with single-process execution, up to the numbers of
+its variables, and it's gathered from the owners of all variables. Ports are
+numbered like variables, but the order of the values on their streams can
+differ from that of a single process.
+"""
+import copyreg
+import logging
+import os
+import pickle
+import sys
+from multiprocessing import get_all_start_methods, get_context
+from queue import Empty
+
+from ozi import (
+    DeadlockError,
+    Ident,
+    Interpreter,
+    Port,
+    Proc,
+    Record,
+    Variable,
+    _EqClass,
+    _frame,
+    _Scheduler,
+)
+
+_BATCH_STEPS = 1000  # steps run by a worker before checking for messages
+_PICKLE_DEPTH = 20000  # recursion limit for pickling deep values, eg. lists
+_POLL_TIMEOUT = 1  # seconds waited for messages before checking on workers
+
+# Types of values whose names differ from the names they're bound to in `ozi`,
+# which thus can't be pickled by reference
+_RENAMED_TYPES = {"Ident": Ident, "Proc": Proc}
+
+
+def _unpickle(name, fields):
+    """Create a value of one of the renamed types."""
+    return _RENAMED_TYPES[name](*fields)
+
+
+for _name, _type in _RENAMED_TYPES.items():
+    copyreg.pickle(
+        _type, lambda value, name=_name: (_unpickle, (name, tuple(value)))
+    )
+
+
+def _put(queue, message):
+    """Put a message on a queue, pickling it first.
+
+    Queues pickle messages in a feeder thread, which drops those that can't
+    be pickled, and the receiver then waits for them forever. They're pickled
+    here instead, so that such errors are raised by the sender. Values like
+    long lists are deeply nested, so the recursion limit is raised meanwhile.
+    """
+    limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(max(limit, _PICKLE_DEPTH))
+    try:
+        data = pickle.dumps(message, pickle.HIGHEST_PROTOCOL)
+    finally:
+        sys.setrecursionlimit(limit)
+    queue.put(data)
+
+
+def _get(queue, block=True, timeout=None):
+    """Get a message put on a queue by `_put`, with the args of `get`."""
+    return pickle.loads(queue.get(block, timeout))
+
+
+class _Store(dict):
+    """SAS of a worker, which creates replicas of unknown variables on use."""
+
+    def __init__(self, on_missing):
+        """Initialize an empty store.
+
+        Args:
+            on_missing (function): The function to call with the number of a
+                variable whose replica has just been created
+
+        """
+        super().__init__()
+        self.on_missing = on_missing
+
+    def __missing__(self, var):
+        """Create an unbound replica of a variable owned by another worker."""
+        eq_class = self[var] = _EqClass(var)
+        self.on_missing(var)
+        return eq_class
+
+
+class _Worker(Interpreter):
+    """Interpreter running some of the threads in a worker process.
+
+    Procedure bodies are always interpreted, as compiled ones allocate
+    variables assuming that the SAS is a list.
+    """
+
+    def __init__(self, wid, num_workers, inbox, outbox, priority_shares):
+        """Initialize the worker's part of the store.
+
+        Args:
+            wid (int): The ID of this worker
+            num_workers (int): The total no. of workers
+            inbox (`multiprocessing.Queue`): The queue of messages from the
+                coordinator
+            outbox (`multiprocessing.Queue`): The queue of messages to the
+                coordinator
+            priority_shares (dict): The relative share of steps for each
+                thread priority
+
+        """
+        super().__init__(
+            jit_threshold=None, optimize=False, priority_shares=priority_shares
+        )
+        self.wid = wid
+        self.num_workers = num_workers
+        self.inbox = inbox
+        self.outbox = outbox
+        self.sas = _Store(self._subscribe)
+        self.subscribers = {}  # workers waiting for owned variables
+        self.received = 0  # no. of messages received, for termination
+        self._num_vars = 0  # no. of variables allocated by this worker
+        self._num_ports = 0  # no. of ports created by this worker
+        self._next_worker = wid  # the worker to hand the next thread over to
+        self._pending = []  # messages to be sent, as (worker, message)
+        self._echo = None  # the variable whose value the owner just sent
+
+    def _owner(self, var):
+        """Get the ID of the worker owning a variable."""
+        return var % self.num_workers
+
+    def _send(self, worker, message):
+        """Queue a message to another worker."""
+        self._pending.append((worker, message))
+
+    def _subscribe(self, var):
+        """Ask the owner of a variable for its value."""
+        self._send(self._owner(var), ("subscribe", var, self.wid))
+
+    def _alloc_var(self, length=16):
+        """Allocate a variable owned by this worker and return it."""
+        new = self._num_vars * self.num_workers + self.wid
+        self._num_vars += 1
+        self.sas[new] = _EqClass(new)
+        return new
+
+    def _bind(self, eq_class, value):
+        """Bind an equivalence class, and send the binding where needed."""
+        super()._bind(eq_class, value)
+        for var in eq_class.vars:
+            owner = self._owner(var)
+            if owner == self.wid:
+                for worker in self.subscribers.pop(var, ()):
+                    self._send(worker, ("bound", var, value))
+            elif var != self._echo:
+                self._send(owner, ("unify", var, value))
+
+    def _merge(self, class1, class2):
+        """Merge two unbound equivalence classes, and tell their owners."""
+        super()._merge(class1, class2)
+        var1, var2 = min(class1.vars), min(class2.vars)
+        for var, other in [(var1, var2), (var2, var1)]:
+            if self._owner(var) != self.wid:
+                self._send(self._owner(var), ("unify", var, Variable(other)))
+
+    def _new_port(self, stream):
+        """Create a port owned by this worker."""
+        port = Port(self._num_ports * self.num_workers + self.wid)
+        self._num_ports += 1
+        self._ports[port.name] = stream
+        return port
+
+    def _port_send(self, port, value):
+        """Send a value to a port, through its owner if it's elsewhere."""
+        owner = self._owner(port.name)
+        if owner == self.wid:
+            super()._port_send(port, value)
+        else:
+            self._send(owner, ("send", port, value))
+
+    def _input_stmt(self, stmt, env):
+        """Refuse to read inputs, whose tails would have to be shared."""
+        raise NotImplementedError("Inputs can't be read by many processes")
+
+    def _new_dictionary(self):
+        """Refuse to create dictionaries, whose entries would be shared."""
+        raise NotImplementedError(
+            "Dictionaries can't be used by many processes"
+        )
+
+    def _new_array(self, low, high, init):
+        """Refuse to create arrays, whose cells would be shared."""
+        raise NotImplementedError("Arrays can't be used by many processes")
+
+    def _unify_values(self, env, lhs, rhs, marked):
+        """Unify two Oz values, treating equal procedures as the same.
+
+        Procedure values are copied between workers, so the same procedure
+        can't be recognized by its identity.
+        """
+        if type(lhs) is Proc and lhs == rhs:
+            return
+        super()._unify_values(env, lhs, rhs, marked)
+
+    def _spawn(self, scheduler, frame, priority):
+        """Create a thread, on the workers in turn."""
+        worker = self._next_worker
+        self._next_worker = (worker + 1) % self.num_workers
+        if worker == self.wid:
+            super()._spawn(scheduler, frame, priority)
+        else:
+            self._send(worker, ("spawn", frame, priority))
+
+    def _receive(self, scheduler, message):
+        """Process a message from another worker."""
+        if message[0] == "subscribe":
+            _, var, worker = message
+            eq_class = self.sas[var]
+            if eq_class.is_bound():
+                self._send(worker, ("bound", var, eq_class.value))
+            else:
+                self.subscribers.setdefault(var, set()).add(worker)
+
+        elif message[0] == "bound":
+            _, var, value = message
+            self._echo = var  # the owner already knows this binding
+            try:
+                self.unify({}, Variable(var), value)
+            finally:
+                self._echo = None
+
+        elif message[0] == "unify":
+            _, var, value = message
+            self.unify({}, Variable(var), value)
+
+        elif message[0] == "spawn":
+            _, frame, priority = message
+            super()._spawn(scheduler, frame, priority)
+
+        elif message[0] == "send":
+            _, port, value = message
+            self._port_send(port, value)
+
+        else:
+            raise ValueError(f"{message} is an invalid message")
+
+    def _owned_store(self):
+        """Get the variables owned by this worker, with their aliases & values.
+
+        Returns:
+            list: The variables, as tuples of the variable, the list of the
+                other variables in its equivalence class, and its value (or
+                None, if it's unbound)
+
+        """
+        entries = []
+        for var, eq_class in self.sas.items():
+            if self._owner(var) == self.wid:
+                aliases = sorted(eq_class.vars - {var})
+                entries.append((var, aliases, eq_class.value))
+        return entries
+
+    def serve(self):
+        """Run threads and process messages until told to stop."""
+        scheduler = _Scheduler(self.priority_shares)
+        while True:
+            if self._pending:
+                _put(self.outbox, (self.wid, "messages", self._pending))
+                self._pending = []
+
+            if len(scheduler) == 0:
+                _put(
+                    self.outbox,
+                    (self.wid, "idle", (self.received, scheduler.parked)),
+                )
+                request = _get(self.inbox)
+            else:
+                try:
+                    request = _get(self.inbox, block=False)
+                except Empty:
+                    request = None
+
+            if request is None:
+                pass
+            elif request[0] == "gather":
+                _put(self.outbox, (self.wid, "store", self._owned_store()))
+                return
+            else:
+                for message in request[1]:
+                    self._receive(scheduler, message)
+                self.received += len(request[1])
+                self._wake(scheduler)
+
+            self._schedule(scheduler, max_steps=_BATCH_STEPS)
+
+
+def _work(wid, num_workers, inbox, outbox, priority_shares):
+    """Run a worker process."""
+    worker = _Worker(wid, num_workers, inbox, outbox, priority_shares)
+    try:
+        worker.serve()
+    except Exception as ex:
+        logging.info("worker %s failed: %r", wid, ex)
+        try:
+            pickle.dumps(ex)
+        except Exception:  # eg. exceptions with extra arguments
+            ex = RuntimeError(repr(ex))
+        _put(outbox, (wid, "error", ex))
+
+
+def _renumber(value, index, memo):
+    """Renumber the SAS variables in a value according to the given index.
+
+    Args:
+        value (`namedtuple`): The value to renumber
+        index (dict): The new number for every variable
+        memo (dict): The values renumbered so far, keyed by their IDs, as
+            values unpickled together share their common parts
+
+    Returns:
+        `namedtuple`: The renumbered value
+
+    """
+    if id(value) in memo:
+        return memo[id(value)]
+
+    if type(value) is Variable:
+        new = Variable(index[value.name])
+    elif type(value) is Record:
+        fields = {
+            feat: _renumber(val, index, memo)
+            for feat, val in value.fields.items()
+        }
+        new = Record(value.literal, fields)
+    elif type(value) is Proc:
+        ctxenv = {name: index[var] for name, var in value.ctxenv.items()}
+        new = value._replace(ctxenv=ctxenv)
+    else:
+        return value
+
+    memo[id(value)] = new
+    return new
+
+
+class ParallelInterpreter(Interpreter):
+    """The Oz interpreter, running threads over many worker processes.
+
+    The first thread runs on the first worker, and every thread hands the
+    threads that it creates over to the workers in turn. Runs can't be traced
+    for memory usage, and scheduler statistics aren't kept.
+    """
+
+    def __init__(self, workers=None, optimize=True, priority_shares=None):
+        """Initialize the single-assignment store.
+
+        Args:
+            workers (int): The no. of worker processes, or None to use the
+                no. of CPUs
+            optimize (bool): Whether to statically optimize the AST before
+                running it
+            priority_shares (dict): The relative share of steps for each
+                thread priority, with the defaults in `ozi.PRIORITY_SHARES`
+
+        """
+        super().__init__(
+            jit_threshold=None,
+            optimize=optimize,
+            priority_shares=priority_shares,
+        )
+        self.workers = workers or os.cpu_count()
+
+    def run(self, ast):
+        """Run the given Oz AST."""
+        self.sas = []  # clear the interpreter
+        self._woken = []
+        ast = self._optimize(ast)
+
+        # Forking is much faster to start workers, where it's available
+        methods = get_all_start_methods()
+        context = get_context("fork" if "fork" in methods else None)
+        inboxes = [context.Queue() for _ in range(self.workers)]
+        outbox = context.Queue()
+        processes = [
+            context.Process(
+                target=_work,
+                args=(wid, self.workers, inbox, outbox, self.priority_shares),
+                daemon=True,
+            )
+            for wid, inbox in enumerate(inboxes)
+        ]
+        for process in processes:
+            process.start()
+
+        main = ("spawn", _frame(ast, {}), "medium")
+        try:
+            _put(inboxes[0], ("messages", [main]))
+            parked = self._coordinate(inboxes, outbox, processes)
+            self._gather(inboxes, outbox, processes)
+        except BaseException:
+            for process in processes:
+                process.terminate()
+            raise
+        finally:
+            for process in processes:
+                process.join()
+
+        if parked > 0:
+            # No thread can run, but some are still waiting for variables
+            raise DeadlockError
+
+    def _coordinate(self, inboxes, outbox, processes):
+        """Route messages between workers until none of them can run.
+
+        Args:
+            inboxes (list): The queue of messages to each worker
+            outbox (`multiprocessing.Queue`): The queue of messages from the
+                workers
+            processes (list): The process of each worker
+
+        Returns:
+            int: The total no. of threads that are parked
+
+        """
+        sent = [0] * self.workers  # no. of messages sent to each worker
+        sent[0] = 1
+        idle = [None] * self.workers  # messages received & threads parked
+
+        while not all(
+            state is not None and state[0] == count
+            for state, count in zip(idle, sent)
+        ):
+            wid, kind, payload = self._next(outbox, processes)
+            if kind == "error":
+                raise payload
+            elif kind == "idle":
+                idle[wid] = payload
+                continue
+
+            messages = {}
+            for worker, message in payload:
+                messages.setdefault(worker, []).append(message)
+            for worker, batch in messages.items():
+                _put(inboxes[worker], ("messages", batch))
+                sent[worker] += len(batch)
+                idle[worker] = None
+
+        return sum(parked for _, parked in idle)
+
+    def _next(self, outbox, processes):
+        """Get the next message from the workers.
+
+        Args:
+            outbox (`multiprocessing.Queue`): The queue of messages from the
+                workers
+            processes (list): The processes of the workers that must still be
+                running
+
+        Returns:
+            tuple: The ID of the worker, the kind of message & its payload
+
+        Raises:
+            RuntimeError: If any of the workers has exited without a message,
+                eg. as it was killed
+
+        """
+        while True:
+            try:
+                return _get(outbox, timeout=_POLL_TIMEOUT)
+            except Empty:
+                pass
+            dead = [process for process in processes if not process.is_alive()]
+            if dead:
+                try:  # any last message, sent just before it exited
+                    return _get(outbox, timeout=_POLL_TIMEOUT)
+                except Empty:
+                    raise RuntimeError(
+                        f"worker process {dead[0].name} exited with code"
+                        f" {dead[0].exitcode}"
+                    ) from None
+
+    def _gather(self, inboxes, outbox, processes):
+        """Gather the final SAS from the owners of all variables.
+
+        Args:
+            inboxes (list): The queue of messages to each worker
+            outbox (`multiprocessing.Queue`): The queue of messages from the
+                workers
+            processes (list): The process of each worker
+
+        """
+        for inbox in inboxes:
+            _put(inbox, ("gather",))
+        entries = []
+        waiting = set(range(self.workers))  # workers yet to send their part
+        while waiting:
+            # Workers exit once they've sent their part
+            wid, kind, payload = self._next(
+                outbox, [processes[wid] for wid in waiting]
+            )
+            if kind == "error":
+                raise payload
+            elif kind == "store":
+                entries.extend(payload)
+                waiting.remove(wid)
+            # Skip any other stale messages
+
+        # Number the variables densely, keeping the order of their numbers
+        index = {var: i for i, (var, _, _) in enumerate(sorted(entries))}
+        self.sas = [_EqClass(i) for i in range(len(index))]
+        for var, aliases, _ in entries:
+            for alias in aliases:
+                self.unify({}, Variable(index[var]), Variable(index[alias]))
+        memo = {}
+        for var, _, value in entries:
+            # Procedures were copied between workers, so bind only once
+            if value is not None and not self.sas[index[var]].is_bound():
+                value = _renumber(value, index, memo)
+                self.unify({}, Variable(index[var]), value)
@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""Daemon running Oz programs sent over a Unix domain socket.
+
+Worker processes are started once, and keep the interpreter imported, the
+programs that they've loaded (& optimized) and an interpreter for each set of
+options, so that running small programs doesn't pay for any of these.
+
+Clients send requests as JSON objects, one per line, and get a response for
+each request, in order, as a JSON object on a line of its own. Requests have
+the program in one of these keys:
+
+* "module": The name of a module with the AST in its `ast` attribute, eg.
+    "testcases.threads".
+* "ast": The AST itself, where `Ident("X")` is written as {"ident": "X"}
+    and `Literal(1)` as {"literal": 1}.
+
+They can also have these keys:
+
+* "id": Any value, which is returned as is in the response.
+* "options": The keyword arguments to `ozi.Interpreter`, out of "optimize",
+    "jit_threshold", "priority_shares", "hash_cons" and "memo_size".
+* "store": Whether to return the final store (true by default).
+
+Responses have the "status" of the run, which is one of "ok", "deadlock" or
+"error", with the "error" type & message for errors, the "time" taken to run
+the program in seconds, and the final "store" as a list of its equivalence
+classes.
+"""
+import json
+import logging
+import os
+from argparse import ArgumentParser
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from importlib import import_module
+from socketserver import StreamRequestHandler, ThreadingUnixStreamServer
+from time import perf_counter
+
+from ozi import (
+    Array,
+    DeadlockError,
+    Dictionary,
+    Ident,
+    Interpreter,
+    Literal,
+    Port,
+    Proc,
+    Record,
+    Variable,
+    Vector,
+    _Optimizer,
+)
+
+_CACHE_SIZE = 256  # programs kept loaded by each worker
+_OPTIONS = {
+    "optimize",
+    "jit_threshold",
+    "priority_shares",
+    "hash_cons",
+    "memo_size",
+}
+
+# State of a worker process
+_programs = OrderedDict()  # loaded ASTs, by program & whether optimized
+_interps = {}  # interpreters, by their options
+
+
+def _decode(obj):
+    """Decode an identifier or literal of an AST in JSON."""
+    if obj.keys() == {"ident"}:
+        return Ident(obj["ident"])
+    elif obj.keys() == {"literal"}:
+        return Literal(obj["literal"])
+    else:
+        raise ValueError(f"{obj} is an invalid AST node")
+
+
+def _encode(value):
+    """Encode a computed Oz value in the store as JSON."""
+    if value is None:  # unbound
+        return None
+    elif type(value) is Literal:
+        return {"literal": value.value}
+    elif type(value) is Variable:
+        return {"var": value.name}
+    elif type(value) is Record:
+        return {
+            "record": value.literal.value,
+            "fields": [
+                [feat.value, _encode(val)]
+                for feat, val in value.fields.items()
+            ],
+        }
+    elif type(value) is Port:
+        return {"port": value.name}
+    elif type(value) is Dictionary:
+        return {"dictionary": value.name}
+    elif type(value) is Array:
+        return {"array": value.name}
+    elif type(value) is Proc:
+        return {"proc": [arg.name for arg in value.args]}
+    elif type(value) is Vector:
+        return {"vector": value.array.tolist()}
+    else:
+        raise TypeError(f"{value} is an invalid value in the store")
+
+
+def _load(program, optimize):
+    """Load a program's AST, if not already loaded by this worker.
+
+    Args:
+        program (tuple): The kind of program ("module" or "ast"), and the
+            module name or the AST in JSON
+        optimize (bool): Whether to optimize the AST
+
+    Returns:
+        list: The AST
+
+    """
+    key = program, optimize
+    if key in _programs:
+        _programs.move_to_end(key)
+        return _programs[key]
+
+    kind, source = program
+    if kind == "module":
+        ast = import_module(source).ast
+    else:
+        ast = json.loads(source, object_hook=_decode)
+    if optimize:
+        ast = _Optimizer().optimize(ast)
+
+    _programs[key] = ast
+    if len(_programs) > _CACHE_SIZE:
+        _programs.popitem(last=False)
+        # Compiled procedures are kept by the IDs of their ASTs, so drop them
+        # along with the evicted program
+        _interps.clear()
+    return ast
+
+
+def _run(program, options, store):
+    """Run a program in a worker process.
+
+    Args:
+        program (tuple): The program, as given to `_load`
+        options (dict): The keyword arguments to `ozi.Interpreter`
+        store (bool): Whether to return the final store
+
+    Returns:
+        dict: The response to the request, without its ID
+
+    """
+    optimize = options.pop("optimize", True)
+    try:
+        ast = _load(program, optimize)
+    except Exception as ex:
+        logging.warning("couldn't load %.80s: %r", program[1], ex)
+        return {
+            "status": "error",
+            "error": {"type": type(ex).__name__, "message": str(ex)},
+        }
+
+    key = json.dumps(options, sort_keys=True)
+    start = perf_counter()
+    try:
+        if key not in _interps:
+            # The ASTs are optimized once when loading them, not every run
+            _interps[key] = Interpreter(optimize=False, **options)
+        _interps[key].run(ast)
+    except DeadlockError:
+        response = {"status": "deadlock"}
+    except Exception as ex:
+        response = {
+            "status": "error",
+            "error": {"type": type(ex).__name__, "message": str(ex)},
+        }
+    else:
+        response = {"status": "ok"}
+    response["time"] = perf_counter() - start
+
+    if key in _interps:
+        interp = _interps[key]
+        if store:
+            eq_classes = {
+                id(eq_class): eq_class
+                for eq_class in interp.sas
+                if eq_class is not None  # collected
+            }
+            response["store"] = [
+                {
+                    "vars": sorted(eq_class.vars),
+                    "value": _encode(eq_class.value),
+                }
+                for eq_class in eq_classes.values()
+            ]
+        interp.sas = []  # don't keep the store alive until the next run
+    return response
+
+
+class _Handler(StreamRequestHandler):
+    """Handler of a client's connection, running its requests in order."""
+
+    def handle(self):
+        """Respond to every request sent over the connection."""
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            request = None
+            try:
+                request = json.loads(line)
+                response = self._respond(request)
+            except ValueError as ex:
+                response = {
+                    "status": "error",
+                    "error": {"type": "InvalidRequest", "message": str(ex)},
+                }
+            # Also for invalid requests, so that clients can match responses
+            if type(request) is dict and "id" in request:
+                response["id"] = request["id"]
+            self.wfile.write(json.dumps(response, default=repr).encode())
+            self.wfile.write(b"\n")
+            self.wfile.flush()
+
+    def _respond(self, request):
+        """Get the response to a decoded request."""
+        if type(request) is not dict:
+            raise ValueError("requests must be JSON objects")
+        elif "module" in request:
+            program = "module", request["module"]
+        elif "ast" in request:
+            # Encoded back to be sent to the worker & used as the cache key
+            program = "ast", json.dumps(request["ast"], sort_keys=True)
+        else:
+            raise ValueError("requests must have a module or an AST")
+
+        options = request.get("options", {})
+        if type(options) is not dict or not options.keys() <= _OPTIONS:
+            raise ValueError(f"options can only be {sorted(_OPTIONS)}")
+        store = request.get("store", True)
+
+        logging.info("running %.80s", program[1])
+        future = self.server.pool.submit(_run, program, options, store)
+        return future.result()
+
+
+def serve(path, workers):
+    """Serve requests on a Unix domain socket until interrupted.
+
+    Args:
+        path (str): The path to the socket, which is replaced if it exists
+        workers (int): The no. of worker processes
+
+    """
+    if os.path.exists(path):
+        os.remove(path)
+
+    with ProcessPoolExecutor(workers) as pool:
+        # Start the workers now, instead of on the first requests
+        warm_up = [("ast", '["nop"]')] * workers
+        list(pool.map(_load, warm_up, [True] * workers))
+
+        with ThreadingUnixStreamServer(path, _Handler) as server:
+            server.daemon_threads = True
+            server.pool = pool
+            logging.info("listening on %s with %s workers", path, workers)
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                os.remove(path)
+
+
+def main(args):
+    """Run the main program.
+
+    Arguments:
+        args (`argparse.Namespace`): The object containing the commandline
+            arguments
+
+    """
+    if args.verbose:
+        logging.basicConfig(level=logging.INFO)
+    serve(args.socket, args.workers)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(
+        description="Daemon running Oz programs sent over a Unix socket"
+    )
+    parser.add_argument(
+        "socket",
+        metavar="SOCKET",
+        type=str,
+        help="the path to the Unix domain socket to listen on",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=os.cpu_count(),
+        help="the no. of worker processes running programs",
+    )
+    parser.add_argument(
+        "-v", "--verbose", action="store_true", help="view some verbose output"
+    )
+    main(parser.parse_args())
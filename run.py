@@ -4,7 +4,8 @@ import logging
 from argparse import ArgumentParser
 from importlib import import_module
 
-from ozi import Interpreter
+from ozi import PRIORITIES, Interpreter
+from ozi_mp import ParallelInterpreter
 
 
 def main(args):
@@ -21,8 +22,80 @@ def main(args):
         logging.basicConfig(level=logging.INFO)
 
     testcase = import_module(f"testcases.{args.testcase}")
-    interp = Interpreter()
-    interp.run(testcase.ast)
+    kwargs = {"optimize": not args.no_optimize}
+    if args.priority_shares is not None:
+        kwargs["priority_shares"] = dict(zip(PRIORITIES, args.priority_shares))
+
+    if args.workers is not None:
+        interp = ParallelInterpreter(workers=args.workers, **kwargs)
+    else:
+        if args.no_jit:
+            kwargs["jit_threshold"] = None
+        if args.mem_report is not None:
+            kwargs["mem_interval"] = args.mem_interval
+        if args.memo_size is not None:
+            kwargs["memo_size"] = args.memo_size
+        interp = Interpreter(
+            hash_cons=args.hash_cons,
+            trace=args.trace,
+            replay=args.replay,
+            **kwargs,
+        )
+
+    try:
+        interp.run(testcase.ast)
+    finally:
+        if args.mem_report is not None:
+            write_mem_report(interp.mem_report, args.mem_report)
+        if args.sched_stats:
+            print_sched_stats(interp.sched_stats)
+        if args.memo_stats:
+            stats = interp.memo_stats
+            print(
+                f"memo statistics: {stats['hits']} hits, "
+                f"{stats['misses']} misses, {stats['evictions']} evictions"
+            )
+        for var in args.show_var or []:
+            print(interp.describe_var(var))
+        for num in args.show_thread or []:
+            print(interp.describe_thread(num))
+
+
+def write_mem_report(report, path):
+    """Write the samples of a memory report and print its high-water marks.
+
+    Arguments:
+        report (`ozi.MemoryReport`): The memory report of the run
+        path (str): The path to the CSV file for the samples
+
+    """
+    with open(path, "w", newline="") as csv_file:
+        report.write_csv(csv_file)
+
+    print("memory high-water marks:")
+    for name, value in report.high_water.items():
+        print(f"  {name}: {value}")
+    for num, depth in sorted(report.stack_high_water.items()):
+        print(f"  stack of thread {num}: {depth}")
+
+
+def print_sched_stats(stats):
+    """Print the per-priority statistics of the scheduler.
+
+    Arguments:
+        stats (dict): The statistics for each priority, as given by
+            `ozi.Interpreter.sched_stats`
+
+    """
+    print("scheduler statistics:")
+    for priority, pri_stats in stats.items():
+        print(
+            f"  {priority}: {pri_stats['steps']} steps, "
+            f"queue length {pri_stats['mean_queue']:.2f} "
+            f"(max {pri_stats['max_queue']}), "
+            f"latency {pri_stats['mean_latency']:.2f} "
+            f"(max {pri_stats['max_latency']}) ticks"
+        )
 
 
 if __name__ == "__main__":
@@ -41,4 +114,111 @@ if __name__ == "__main__":
     parser.add_argument(
         "-d", "--debug", action="store_true", help="view logging output"
     )
-    main(parser.parse_args())
+    parser.add_argument(
+        "--no-jit",
+        action="store_true",
+        help="never compile hot procedures into Python functions",
+    )
+    parser.add_argument(
+        "--no-optimize",
+        action="store_true",
+        help="run the AST as is, without optimizing it statically",
+    )
+    parser.add_argument(
+        "--mem-report",
+        metavar="FILE",
+        type=str,
+        help="sample memory usage into the given CSV file",
+    )
+    parser.add_argument(
+        "--mem-interval",
+        metavar="TICKS",
+        type=int,
+        default=100,
+        help="the no. of ticks between samples of memory usage",
+    )
+    parser.add_argument(
+        "--priority-shares",
+        metavar=("HIGH", "MEDIUM", "LOW"),
+        nargs=3,
+        type=int,
+        help="the relative share of steps for each thread priority",
+    )
+    parser.add_argument(
+        "--sched-stats",
+        action="store_true",
+        help="print queue lengths and latencies of each thread priority",
+    )
+    parser.add_argument(
+        "--hash-cons",
+        action="store_true",
+        help="share one copy of structurally equal ground records",
+    )
+    parser.add_argument(
+        "--memo-size",
+        metavar="N",
+        type=int,
+        help="the max. no. of memoized calls of tabled procedures (0 to not"
+        " memoize calls)",
+    )
+    parser.add_argument(
+        "--memo-stats",
+        action="store_true",
+        help="print the hits, misses and evictions of memoized calls",
+    )
+    parser.add_argument(
+        "--trace",
+        metavar="FILE",
+        type=str,
+        help="record a binary trace of thread switches, binds, suspensions"
+        " and spawns into the given file (see tracetool.py)",
+    )
+    parser.add_argument(
+        "--replay",
+        metavar="FILE",
+        type=str,
+        help="repeat the interleaving of threads in the given trace, which"
+        " must be of the same testcase with the same options",
+    )
+    parser.add_argument(
+        "--show-var",
+        metavar="VAR",
+        type=int,
+        action="append",
+        help="print the full state of this store variable after the run"
+        " (can be repeated)",
+    )
+    parser.add_argument(
+        "--show-thread",
+        metavar="NUM",
+        type=int,
+        action="append",
+        help="print the full state of this thread after the run, eg. on a"
+        " deadlock (can be repeated)",
+    )
+    parser.add_argument(
+        "--workers",
+        metavar="N",
+        type=int,
+        help="run threads over N worker processes (experimental)",
+    )
+
+    args = parser.parse_args()
+    # Options that only work with a single process
+    single = [
+        "mem_report",
+        "sched_stats",
+        "hash_cons",
+        "memo_size",
+        "memo_stats",
+        "trace",
+        "replay",
+        "show_var",
+        "show_thread",
+    ]
+    if args.workers is not None and any(
+        vars(args)[opt] not in (None, False) for opt in single
+    ):
+        options = "/".join(f"--{opt.replace('_', '-')}" for opt in single)
+        parser.error(f"--workers can't be used with {options}")
+    main(args)
@@ -17,4 +17,14 @@ for i in testcases/*.py; do
     fi
 done
 
+# Deep values must also be sent between worker processes, without hanging
+((total++))
+timeout 60 ./run.py -v --workers 2 deep_list &>/dev/null
+if (( $? == 0 )); then
+    echo "deep_list (2 workers): passed"
+    ((pass++))
+else
+    echo "deep_list (2 workers): failed"
+fi
+
 echo "$pass/$total tests passed"
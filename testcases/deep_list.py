@@ -0,0 +1,35 @@
+"""Testcase for a long list, bound by threads on different workers."""
+from ozi import Ident, Literal
+
+LENGTH = 300
+
+items = Literal(None)
+for i in range(LENGTH):
+    items = [
+        "record",
+        Literal("|"),
+        [(Literal("1"), Literal(i)), (Literal("2"), items)],
+    ]
+
+cons = [
+    "record",
+    Literal("|"),
+    [(Literal("1"), Ident("h")), (Literal("2"), Ident("t"))],
+]
+
+ast = [
+    # With many workers, the second thread runs on another worker than the
+    # first, and so its list is sent to the worker owning `ys`
+    ["thread", ["bind", Ident("xs"), items]],
+    ["thread", ["bind", Ident("ys"), items]],
+    ["bind", Ident("xs"), Ident("ys")],
+    [
+        "match",
+        Ident("xs"),
+        cons,
+        ["bind", Ident("h"), Literal(LENGTH - 1)],
+        ["bind", Ident("xs"), Literal(None)],  # fails
+    ],
+]
+for name in ["xs", "ys", "h"]:
+    ast = ["var", Ident(name), ast]
@@ -0,0 +1,44 @@
+"""Testcase for dictionaries & arrays."""
+from ozi import Ident, Literal
+
+dictionary = [
+    ["dictionary", "new", Ident("d")],
+    ["dictionary", "put", Ident("d"), Literal(1), Literal(10)],
+    ["dictionary", "put", Ident("d"), Literal("a"), Ident("y")],
+    ["thread", ["bind", Ident("y"), Literal(5)]],
+    ["dictionary", "get", Ident("d"), Literal(1), Ident("x")],
+    ["bind", Ident("x"), Literal(10)],
+    ["dictionary", "get", Ident("d"), Literal("a"), Ident("z")],
+    # Waits for the thread to bind the value in the dictionary
+    ["bind", Ident("w"), ["product", Ident("z"), Literal(2)]],
+    ["bind", Ident("w"), Literal(10)],
+    [
+        "dictionary",
+        "condGet",
+        Ident("d"),
+        Literal("b"),
+        Literal(0),
+        Ident("m"),
+    ],
+    ["bind", Ident("m"), Literal(0)],
+    ["dictionary", "remove", Ident("d"), Literal(1)],
+    ["dictionary", "size", Ident("d"), Ident("n")],
+    ["bind", Ident("n"), Literal(1)],
+]
+
+array = [
+    ["array", "new", Literal(1), Literal(3), Literal(0), Ident("a")],
+    ["array", "put", Ident("a"), Literal(2), Literal(7)],
+    ["array", "get", Ident("a"), Literal(2), Ident("b")],
+    ["bind", Ident("b"), Literal(7)],
+    ["array", "get", Ident("a"), Literal(3), Ident("c")],
+    ["bind", Ident("c"), Literal(0)],
+    ["array", "condGet", Ident("a"), Literal(4), Literal(-1), Ident("e")],
+    ["bind", Ident("e"), Literal(-1)],
+    ["array", "size", Ident("a"), Ident("s")],
+    ["bind", Ident("s"), Literal(3)],
+]
+
+ast = dictionary + array
+for name in ["d", "y", "x", "z", "w", "m", "n", "a", "b", "c", "e", "s"]:
+    ast = ["var", Ident(name), ast]
@@ -0,0 +1,76 @@
+"""Testcase for reading a list from an input file."""
+import os
+
+from ozi import Ident, Literal
+
+ast = [
+    "var",
+    Ident("xs"),
+    [
+        "var",
+        Ident("sum"),
+        [
+            "var",
+            Ident("zero"),
+            [
+                "var",
+                Ident("r"),
+                [
+                    [
+                        "input",
+                        Ident("xs"),
+                        os.path.join(os.path.dirname(__file__), "inputs.txt"),
+                    ],
+                    [
+                        "bind",
+                        Ident("sum"),
+                        [
+                            "proc",
+                            [Ident("l"), Ident("acc"), Ident("r")],
+                            [
+                                "match",
+                                Ident("l"),
+                                [
+                                    "record",
+                                    Literal("|"),
+                                    [
+                                        (Literal("1"), Ident("h")),
+                                        (Literal("2"), Ident("t")),
+                                    ],
+                                ],
+                                [
+                                    "var",
+                                    Ident("a"),
+                                    [
+                                        [
+                                            "bind",
+                                            Ident("a"),
+                                            ["sum", Ident("acc"), Ident("h")],
+                                        ],
+                                        [
+                                            "apply",
+                                            Ident("sum"),
+                                            Ident("t"),
+                                            Ident("a"),
+                                            Ident("r"),
+                                        ],
+                                    ],
+                                ],
+                                ["bind", Ident("r"), Ident("acc")],
+                            ],
+                        ],
+                    ],
+                    ["bind", Ident("zero"), Literal(0)],
+                    [
+                        "apply",
+                        Ident("sum"),
+                        Ident("xs"),
+                        Ident("zero"),
+                        Ident("r"),
+                    ],
+                    ["bind", Ident("r"), Literal(55)],
+                ],
+            ],
+        ],
+    ],
+]
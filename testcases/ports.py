@@ -0,0 +1,48 @@
+"""Testcase for ports."""
+from ozi import Ident, Literal
+
+ast = [
+    "var",
+    Ident("s"),
+    [
+        "var",
+        Ident("p"),
+        [
+            ["newport", Ident("s"), Ident("p")],
+            ["thread", ["send", Ident("p"), Literal(1)]],
+            ["thread", ["send", Ident("p"), Literal(2)]],
+            [
+                "match",
+                Ident("s"),
+                [
+                    "record",
+                    Literal("|"),
+                    [(Literal("1"), Ident("h1")), (Literal("2"), Ident("t1"))],
+                ],
+                [
+                    "match",
+                    Ident("t1"),
+                    [
+                        "record",
+                        Literal("|"),
+                        [
+                            (Literal("1"), Ident("h2")),
+                            (Literal("2"), Ident("t2")),
+                        ],
+                    ],
+                    [
+                        "var",
+                        Ident("z"),
+                        [
+                            "bind",
+                            Ident("z"),
+                            ["sum", Ident("h1"), Ident("h2")],
+                        ],
+                    ],
+                    ["nop"],
+                ],
+                ["nop"],
+            ],
+        ],
+    ],
+]
@@ -0,0 +1,38 @@
+"""Testcase for thread priorities."""
+from ozi import Ident, Literal
+
+ast = [
+    "var",
+    Ident("x"),
+    [
+        "var",
+        Ident("y"),
+        [
+            [
+                "thread",
+                [
+                    ["nop"],
+                    ["nop"],
+                    ["bind", Ident("x"), Literal(1)],
+                ],
+                "low",
+            ],
+            [
+                "thread",
+                [
+                    [
+                        "thread",
+                        ["bind", Ident("y"), ["sum", Ident("x"), Literal(1)]],
+                    ],
+                    ["nop"],
+                ],
+                "high",
+            ],
+            [
+                "var",
+                Ident("z"),
+                ["bind", Ident("z"), ["product", Ident("y"), Literal(2)]],
+            ],
+        ],
+    ],
+]
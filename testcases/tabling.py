@@ -0,0 +1,38 @@
+"""Testcase for tabled procedures."""
+from ozi import Ident, Literal
+
+ast = [
+    "var",
+    Ident("square"),
+    [
+        [
+            "bind",
+            Ident("square"),
+            [
+                "proc",
+                [Ident("x"), Ident("y")],
+                ["bind", Ident("y"), ["product", Ident("x"), Ident("x")]],
+                "memo",
+            ],
+        ],
+        [
+            "var",
+            Ident("a"),
+            [
+                "var",
+                Ident("b"),
+                [
+                    "var",
+                    Ident("three"),
+                    [
+                        ["bind", Ident("three"), Literal(3)],
+                        ["apply", Ident("square"), Ident("three"), Ident("a")],
+                        ["apply", Ident("square"), Ident("three"), Ident("b")],
+                        ["bind", Ident("a"), Ident("b")],
+                        ["bind", Ident("b"), Literal(9)],
+                    ],
+                ],
+            ],
+        ],
+    ],
+]
@@ -0,0 +1,22 @@
+"""Testcase for a tabled procedure with effects through its closure."""
+from ozi import Ident, Literal
+
+put = [
+    "proc",
+    [Ident("k")],
+    ["dictionary", "put", Ident("d"), Ident("k"), Ident("k")],
+]
+# Memoized calls would skip putting the key in the dictionary, so this can't
+# be tabled
+count = ["proc", [Ident("k")], ["apply", Ident("put"), Ident("k")], "memo"]
+
+ast = [
+    ["dictionary", "new", Ident("d")],
+    ["bind", Ident("put"), put],
+    ["bind", Ident("count"), count],
+    ["bind", Ident("one"), Literal(1)],
+    ["apply", Ident("count"), Ident("one")],
+    ["apply", Ident("count"), Ident("one")],
+]
+for name in ["d", "put", "count", "one"]:
+    ast = ["var", Ident(name), ast]
@@ -0,0 +1,24 @@
+"""Testcase for a tabled procedure waiting for an argument bound later."""
+from ozi import Ident, Literal
+
+double = [
+    "proc",
+    [Ident("x"), Ident("y")],
+    ["bind", Ident("y"), ["product", Ident("x"), Literal(2)]],
+    "memo",
+]
+
+ast = [
+    ["bind", Ident("double"), double],
+    ["thread", ["apply", Ident("double"), Ident("a"), Ident("b")]],
+    # Give the call time to wait for its input
+    ["bind", Ident("e"), Literal(1)],
+    ["bind", Ident("e"), ["sum", Ident("e"), Literal(0)]],
+    ["bind", Ident("a"), Literal(3)],
+    ["bind", Ident("e"), ["sum", Ident("b"), Literal(-5)]],  # waits for b
+    # The first call's result can't be reused, as it only got its input from
+    # another thread, and so this waits for its input forever
+    ["apply", Ident("double"), Ident("c"), Ident("d")],
+]
+for name in ["double", "a", "b", "c", "d", "e"]:
+    ast = ["var", Ident(name), ast]
@@ -0,0 +1,47 @@
+"""Testcase for vectors."""
+from ozi import Ident, Literal
+
+
+def _list(*items):
+    """Get the AST of a list of literals."""
+    ast = Literal(None)
+    for item in reversed(items):
+        ast = [
+            "record",
+            Literal("|"),
+            [(Literal("1"), Literal(item)), (Literal("2"), ast)],
+        ]
+    return ast
+
+
+ast = [
+    "var",
+    Ident("v"),
+    [
+        "var",
+        Ident("w"),
+        [
+            "var",
+            Ident("s"),
+            [
+                "var",
+                Ident("i"),
+                [
+                    [
+                        "thread",
+                        [
+                            "bind",
+                            Ident("w"),
+                            ["product", Ident("v"), Ident("v")],
+                        ],
+                    ],
+                    ["bind", Ident("v"), ["vector", _list(1, 2, 3)]],
+                    ["bind", Ident("s"), ["reduce", "sum", Ident("w")]],
+                    ["bind", Ident("i"), ["index", Ident("w"), Literal(2)]],
+                    ["bind", Ident("s"), Literal(14)],
+                    ["bind", Ident("i"), Literal(4)],
+                ],
+            ],
+        ],
+    ],
+]
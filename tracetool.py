@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""Summarize binary traces recorded by the Oz interpreter."""
+from argparse import ArgumentParser
+from bisect import bisect_right
+from collections import Counter
+
+from ozi import read_trace
+
+
+def load(path):
+    """Load the events of a trace file, as given by `ozi.read_trace`."""
+    with open(path, "rb") as trace_file:
+        return list(read_trace(trace_file))
+
+
+def dump(events):
+    """Print every event of a trace on a line of its own."""
+    for kind, tick, thread, arg in events:
+        print(f"{tick:>8} thread {thread:<6} {kind:<8} {arg}")
+
+
+def waits(events):
+    """Get the waits of threads for variables in a trace.
+
+    Args:
+        events (list): The events of the trace
+
+    Returns:
+        dict: The waits of each thread, by thread no., as lists of the var
+            waited for, the ticks at which the wait started & ended, and the
+            no. of the thread that woke it up (both None if never woken)
+
+    """
+    waits = {}
+    pending = {}  # the index of the current wait of each suspended thread
+    for kind, tick, thread, arg in events:
+        if kind == "suspend":
+            thread_waits = waits.setdefault(thread, [])
+            pending[thread] = len(thread_waits)
+            thread_waits.append((arg, tick, None, None))
+        elif kind == "wake":
+            index = pending.pop(arg)
+            var, start, _, _ = waits[arg][index]
+            waits[arg][index] = (var, start, tick, thread)
+    return waits
+
+
+def hotspots(events, top):
+    """Print the threads & variables where most of the time was spent.
+
+    Args:
+        events (list): The events of the trace
+        top (int): The no. of entries to print for each list
+
+    """
+    steps = Counter()
+    last_tick, last_thread = 0, 0
+    for kind, tick, thread, _ in events:
+        if kind in {"switch", "end"}:
+            steps[last_thread] += tick - last_tick
+            last_tick, last_thread = tick, thread
+    suspends = Counter(arg for kind, _, _, arg in events if kind == "suspend")
+    binds = Counter(thread for kind, _, thread, _ in events if kind == "bind")
+
+    waited = Counter()
+    for thread, thread_waits in waits(events).items():
+        for _, start, end, _ in thread_waits:
+            waited[thread] += (last_tick if end is None else end) - start
+
+    print(f"{last_tick} ticks, {len(steps)} threads")
+    print("threads by steps run:")
+    for thread, count in steps.most_common(top):
+        print(f"  thread {thread}: {count} steps, {binds[thread]} binds")
+    print("threads by ticks spent suspended:")
+    for thread, count in waited.most_common(top):
+        print(f"  thread {thread}: {count} ticks")
+    print("variables by suspensions on them:")
+    for var, count in suspends.most_common(top):
+        print(f"  variable {var}: {count} suspensions")
+
+
+def chains(events, top):
+    """Print the longest chains of threads waiting for each other.
+
+    A thread woken up by another one waited for it, and in turn for whatever
+    that thread last waited for before waking it up.
+
+    Args:
+        events (list): The events of the trace
+        top (int): The no. of chains to print
+
+    """
+    all_waits = waits(events)
+    # A thread waits for one variable at a time, so its waits end in order
+    ends = {
+        thread: [end for _, _, end, _ in thread_waits if end is not None]
+        for thread, thread_waits in all_waits.items()
+    }
+
+    def chain(thread, before):
+        """Get the chain of waits of a thread, from its last one by a tick."""
+        links = []
+        while True:
+            index = bisect_right(ends.get(thread, []), before) - 1
+            if index < 0:
+                return links
+            var, start, end, waker = all_waits[thread][index]
+            links.append((thread, var, start, end, waker))
+            thread, before = waker, end
+
+    found = []
+    for thread, thread_waits in all_waits.items():
+        for var, start, end, waker in thread_waits:
+            if end is None:
+                print(f"thread {thread} still waits for {var} since {start}")
+            else:
+                found.append([(thread, var, start, end, waker)])
+                found[-1] += chain(waker, end)
+
+    found.sort(key=lambda links: (len(links), links[0][3] - links[0][2]))
+    for links in reversed(found[-top:]):
+        print(f"chain of {len(links)} waits:")
+        for thread, var, start, end, waker in links:
+            print(
+                f"  thread {thread} waited for {var} from {start} to {end},"
+                f" until thread {waker} bound it"
+            )
+
+
+def main(args):
+    """Run the main program.
+
+    Arguments:
+        args (`argparse.Namespace`): The object containing the commandline
+            arguments
+
+    """
+    events = load(args.trace)
+    if args.command == "dump":
+        dump(events)
+    elif args.command == "hotspots":
+        hotspots(events, args.top)
+    else:
+        chains(events, args.top)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(
+        description="Tool to summarize traces of the Oz interpreter"
+    )
+    parser.add_argument(
+        "command",
+        metavar="COMMAND",
+        choices=["dump", "hotspots", "chains"],
+        help="what to print: all events (dump), where the time was spent"
+        " (hotspots), or chains of threads waiting for each other (chains)",
+    )
+    parser.add_argument(
+        "trace",
+        metavar="TRACE",
+        type=str,
+        help="the trace file recorded with `run.py --trace`",
+    )
+    parser.add_argument(
+        "-n",
+        "--top",
+        type=int,
+        default=10,
+        help="the no. of entries to print in summaries",
+    )
+    main(parser.parse_args())